@@ -1,32 +1,55 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, EmailStr, ValidationError
+from typing import List, Optional, Dict, Any, Callable, Awaitable, AsyncIterator, Iterator
 import uvicorn
 import os
+import io
+import zipfile
 import json
 import aiofiles
 import tempfile
 import csv
 import hashlib
+import hmac
+import base64
 import secrets
+import multiprocessing
+import asyncio
+import functools
+import time
+import threading
+import random
+import re
+import bisect
+import sqlite3
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, date
 import logging
 
 # PDF processing imports
 import PyPDF2
 import pdfplumber
-import pytesseract
+import pypdfium2 as pdfium
 from PIL import Image
-import cv2
-import numpy as np
+
+# OCR lives in its own module so OCR worker processes can import it without this app.
+# Imported as backend.main by run_backend.py, or as main when started from inside backend/
+try:
+    from backend.ocr import OCRPreprocessConfig, get_ocr_engine, ocr_pdf_pages, reset_ocr_engine
+except ModuleNotFoundError:
+    from ocr import OCRPreprocessConfig, get_ocr_engine, ocr_pdf_pages, reset_ocr_engine
 
 # AI imports
 import google.generativeai as genai
+import google.api_core.exceptions as google_exceptions
 import openai
+import httpx
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -78,6 +101,10 @@ class UserResponse(BaseModel):
     full_name: str
     created_at: str
 
+class UserPage(BaseModel):
+    users: List[Dict[str, str]]
+    next_cursor: Optional[str] = None
+
 class AuthResponse(BaseModel):
     access_token: str
     token_type: str
@@ -131,6 +158,39 @@ class CombinedProcessingResult(BaseModel):
     total_classes: int
     classes_per_working_day: int
     weekly_schedule: Dict[str, List[TimetableEvent]]
+    stage_timings: Optional[Dict[str, float]] = None
+
+class CalendarPageReport(BaseModel):
+    page: int
+    fingerprint: Optional[str] = None
+    extraction: str  # text, pdfplumber, ocr or cache
+    analysis: str  # analyzed, cached, unconfident (low-confidence fallback, not merged) or skipped
+    changed: bool
+
+class CalendarRevisionResult(BaseModel):
+    sha256: str
+    previous_sha256: Optional[str] = None
+    result: PDFProcessingResult
+    pages: List[CalendarPageReport]
+    changed_pages: List[int]
+    added_events: List[CalendarEvent]
+    removed_events: List[CalendarEvent]
+
+class JobEvent(BaseModel):
+    status: str
+    stage: Optional[str] = None
+    timestamp: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # queued, running, completed, failed
+    stage: Optional[str] = None
+    created_at: str
+    updated_at: str
+    events: List[JobEvent]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
 
 class AttendanceStats(BaseModel):
     total_classes: int
@@ -140,28 +200,763 @@ class AttendanceStats(BaseModel):
     classes_to_attend_for_target: int
     target_percentage: float = 75.0
 
-# Configuration
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Upload configuration
+# Uploads are streamed into memory in chunks and rejected as soon as they pass MAX_FILE_SIZE
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+PDF_EXTENSIONS = ['.pdf']
+TIMETABLE_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png']
+COMBINED_UPLOAD_ERROR = "Calendar must be PDF; Timetable must be PDF or image (.pdf, .jpg, .jpeg, .png)"
+
+# Background job configuration
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "100"))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+
+# Batch processing configuration
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", "4"))
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "16"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_ARCHIVE_SIZE = int(os.getenv("BATCH_MAX_ARCHIVE_SIZE", str(200 * 1024 * 1024)))
+# Cap on the total (decompressed) bytes ingested per batch, so a zip bomb cannot exhaust memory
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("BATCH_MAX_TOTAL_BYTES", str(512 * 1024 * 1024)))
+
+# Extraction cache configuration
+# Bump EXTRACTOR_VERSION whenever extraction output changes so stale entries are ignored
+EXTRACTOR_VERSION = "3"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join("cache", "extraction"))
+EXTRACTION_CACHE_MEMORY_ITEMS = int(os.getenv("EXTRACTION_CACHE_MEMORY_ITEMS", "128"))
+EXTRACTION_CACHE_DISK_BYTES = int(os.getenv("EXTRACTION_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+# Per-page results keyed by page fingerprint, so revised PDFs only redo changed pages
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", os.path.join("cache", "pages"))
+PAGE_CACHE_MEMORY_ITEMS = int(os.getenv("PAGE_CACHE_MEMORY_ITEMS", "2048"))
+PAGE_CACHE_DISK_BYTES = int(os.getenv("PAGE_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+# Parsed LLM analyses; set LLM_CACHE_DISK_BYTES=0 for a memory-only cache, LLM_CACHE_TTL_SECONDS=0 to disable
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join("cache", "llm"))
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+LLM_CACHE_DISK_BYTES = int(os.getenv("LLM_CACHE_DISK_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Bump when a prompt template changes so cached analyses from the old prompt are not reused
+CALENDAR_PROMPT_VERSION = "3"
+TIMETABLE_PROMPT_VERSION = "2"
+
+# OCR configuration
+# Number of processes used to OCR scanned PDFs; 1 keeps the serial page loop
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+# Start method for OCR processes; forking the threaded server could copy held locks into the children
+OCR_START_METHOD = os.getenv(
+    "OCR_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+# Pages with fewer text-layer characters than this are treated as scanned and OCR'd
+MIN_PAGE_TEXT_CHARS = int(os.getenv("MIN_PAGE_TEXT_CHARS", "20"))
+
+# Blocking work configuration
+# Extraction/OCR runs on a bounded thread pool so it never blocks the event loop
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+EXECUTOR_MAX_QUEUE = int(os.getenv("EXECUTOR_MAX_QUEUE", "32"))
+
+# LLM provider configuration
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+# Point at any OpenAI-compatible server, e.g. benchmarks/llm_stub_server.py for offline load tests
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+# Maximum LLM requests in flight across the whole process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+# Per-attempt timeout, and the overall deadline for one call including retries
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+# Providers in priority order ("openai", "gemini", "stub"); empty means every provider with an API key
+LLM_PROVIDERS = [name.strip() for name in os.getenv("LLM_PROVIDERS", "").split(",") if name.strip()]
+# A provider failing this many calls in a row is skipped for LLM_BREAKER_RESET_SECONDS
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Hedging: if the first provider has not answered after its p95 latency, also ask the next one
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "5"))  # until enough samples exist
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Offline stub provider
+LLM_STUB_LATENCY_SECONDS = float(os.getenv("LLM_STUB_LATENCY_SECONDS", "0.05"))
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+# Long documents are analyzed in chunks of at most LLM_CHUNK_CHARS, this many at a time per document
+LLM_CHUNK_CHARS = int(os.getenv("LLM_CHUNK_CHARS", "4000"))
+LLM_CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", "4"))
+# Local parsers answer first; the LLM is only called when their confidence is below this
+# threshold or required fields are missing (set above 1.0 to always use the LLM)
+ANALYSIS_CONFIDENCE_THRESHOLD = float(os.getenv("ANALYSIS_CONFIDENCE_THRESHOLD", "0.7"))
+# Drop text segments without dates, weekdays, times, day counts or event keywords before prompting
+PROMPT_FILTER_ENABLED = os.getenv("PROMPT_FILTER_ENABLED", "true").lower() == "true"
+PROMPT_FILTER_CONTEXT = int(os.getenv("PROMPT_FILTER_CONTEXT", "1"))
 
 # User authentication configuration
-USERS_CSV_FILE = "users.csv"
+USERS_CSV_FILE = os.getenv("USERS_CSV_FILE", "users.csv")
+# User store: "sqlite" (indexed, at DATABASE_URL) or "csv" (USERS_CSV_FILE, for small deployments)
+USER_STORE = os.getenv("USER_STORE", "sqlite")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///users.db")
 TOKEN_SECRET = os.getenv("TOKEN_SECRET", "your-secret-key-change-in-production")
+# Access tokens are HMAC-signed with TOKEN_SECRET and verified without touching the user store
+ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", str(24 * 3600)))
+# Authenticated requests reuse user records for this long before re-reading the store
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_ITEMS = int(os.getenv("USER_CACHE_ITEMS", "4096"))
+# Logins are buffered in memory and written to the user store in one batch this often
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv("LAST_LOGIN_FLUSH_SECONDS", "10"))
+# Registrations are committed by a single writer in batches of up to REGISTRATION_BATCH_MAX,
+# waiting at most REGISTRATION_BATCH_WAIT_MS for a batch to fill (one fsync per batch)
+REGISTRATION_BATCH_MAX = int(os.getenv("REGISTRATION_BATCH_MAX", "256"))
+REGISTRATION_BATCH_WAIT_MS = float(os.getenv("REGISTRATION_BATCH_WAIT_MS", "2"))
+# /users page size when no limit is given, and the largest limit accepted
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "100"))
+USERS_PAGE_MAX = int(os.getenv("USERS_PAGE_MAX", "1000"))
 
 # Initialize OpenAI client
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if OPENAI_API_KEY:
-    from openai import OpenAI
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-    logger.info("OpenAI client initialized successfully")
-elif GEMINI_API_KEY:
-    import google.generativeai as genai
-    genai.configure(api_key=GEMINI_API_KEY)
-    logger.info("Gemini client initialized successfully")
-else:
-    logger.warning("No OpenAI or Gemini API key found. AI features will be limited.")
+# LLM providers
+class LLMProvider:
+    """A chat model that turns a prompt into response text"""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def complete(self, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        """Yield the response in pieces as it is generated; providers without streaming yield it whole"""
+        yield await self.complete(prompt, timeout)
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions over a pooled keep-alive HTTP client"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None):
+        super().__init__(model)
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=5.0)
+        )
+        # Retries are handled by LLMClient so they share its deadline and backoff
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+
+    async def complete(self, prompt: str, timeout: float) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1000,
+            temperature=0.7,
+            timeout=timeout
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1000,
+            temperature=0.7,
+            timeout=timeout,
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def aclose(self):
+        await self.client.close()
+
+class GeminiProvider(LLMProvider):
+    """Gemini via the async generate_content API; the model object is created once"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__(model)
+        genai.configure(api_key=api_key)
+        self.client = genai.GenerativeModel(model)
+
+    async def complete(self, prompt: str, timeout: float) -> str:
+        response = await self.client.generate_content_async(prompt, request_options={"timeout": timeout})
+        return response.text
+
+    async def stream(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        response = await self.client.generate_content_async(prompt, stream=True, request_options={"timeout": timeout})
+        async for chunk in response:
+            yield chunk.text
+
+RETRYABLE_LLM_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
+class LLMDeadlineExceeded(Exception):
+    """An LLM call did not succeed within its overall deadline"""
+
+class LLMUnavailable(Exception):
+    """Every configured provider's circuit breaker is open"""
+
+class InvalidLLMResponse(Exception):
+    """A provider answered, but not with usable JSON"""
+
+class StubProvider(LLMProvider):
+    """Offline provider answering from the local parsers, with configurable latency and error rate"""
+
+    name = "stub"
+
+    def __init__(self, latency_seconds: float, error_rate: float):
+        super().__init__("local-parsers")
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+
+    async def complete(self, prompt: str, timeout: float) -> str:
+        await asyncio.sleep(self.latency_seconds)
+        if random.random() < self.error_rate:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://stub.invalid/v1/chat/completions"))
+        text = prompt.split("Text from PDF:\n", 1)[-1].split("\n\nPlease provide a JSON response", 1)[0]
+        if "timetable text" in prompt[:200]:
+            return json.dumps(extract_basic_timetable(text))
+        analysis = extract_basic_dates(text)
+        analysis.pop("extracted_text", None)
+        return json.dumps(analysis)
+
+class CircuitBreaker:
+    """Opens after consecutive failures; after reset_seconds lets one trial call through (half-open)"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def can_try(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def allow(self) -> bool:
+        """Like can_try, but claims the single half-open trial call"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+class ProviderStats:
+    """Rolling latency and outcome counters for one provider"""
+
+    def __init__(self, window: int = 200):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.invalid = 0
+        self.cancelled = 0
+
+    def record(self, outcome: str, seconds: float):
+        self.calls += 1
+        if outcome == "ok":
+            self.latencies.append(seconds)
+        elif outcome == "invalid":
+            self.invalid += 1
+        elif outcome == "failure":
+            self.failures += 1
+        elif outcome == "cancelled":
+            self.cancelled += 1
+        if outcome != "cancelled":
+            self.outcomes.append(outcome == "ok")
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "invalid": self.invalid,
+            "cancelled": self.cancelled,
+            "error_rate": round(1 - sum(self.outcomes) / len(self.outcomes), 4) if self.outcomes else 0.0,
+            "p50_seconds": round(p50, 4) if p50 is not None else None,
+            "p95_seconds": round(p95, 4) if p95 is not None else None
+        }
+
+def extract_first_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} in text, ignoring braces inside strings"""
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        escape = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == "\\":
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:index + 1]
+        start = text.find("{", start + 1)
+    return None
+
+# Top-level list each analysis task answers with
+LLM_ITEMS_KEYS = {"calendar": "events", "timetable": "timetable_events"}
+
+def parse_llm_json(text: str, required_keys: tuple = tuple(LLM_ITEMS_KEYS.values())) -> tuple:
+    """Parse an LLM reply into a dict, returning (parsed or None, repair path)
+
+    Paths: "direct" (valid JSON), "fenced" (inside ``` fences), "extracted" (first balanced
+    object amid prose), "failed". An extracted object only counts if it has one of
+    `required_keys`; in a truncated reply the first balanced object is a single item,
+    not the analysis.
+    """
+    candidates = [("direct", text)]
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text or "", re.DOTALL)
+    if fenced:
+        candidates.append(("fenced", fenced.group(1)))
+    for path, candidate in candidates:
+        try:
+            parsed = json.loads(candidate)
+            if isinstance(parsed, dict):
+                return parsed, path
+        except (json.JSONDecodeError, TypeError):
+            pass
+    embedded = extract_first_json_object(text or "")
+    if embedded is not None:
+        try:
+            parsed = json.loads(embedded)
+            if any(key in parsed for key in required_keys):
+                return parsed, "extracted"
+        except json.JSONDecodeError:
+            pass
+    return None, "failed"
+
+def is_valid_json_response(text: str) -> bool:
+    return parse_llm_json(text)[0] is not None
+
+class ProviderRouter(LLMProvider):
+    """Routes calls across providers in priority order with per-provider circuit breakers
+
+    Failing or invalid answers fail over to the next provider. With hedging on, the next
+    provider is also asked once the first has been slower than its own p95 latency, and
+    the first valid JSON answer wins.
+    """
+
+    name = "router"
+
+    def __init__(
+        self,
+        providers: List[LLMProvider],
+        breaker_failures: int,
+        breaker_reset_seconds: float,
+        hedge: bool,
+        hedge_delay_seconds: float,
+        hedge_min_samples: int,
+        validate: Callable[[str], bool] = is_valid_json_response
+    ):
+        super().__init__("+".join(f"{provider.name}:{provider.model}" for provider in providers))
+        self.providers = providers
+        self.breakers = {provider.name: CircuitBreaker(breaker_failures, breaker_reset_seconds) for provider in providers}
+        self.provider_stats = {provider.name: ProviderStats() for provider in providers}
+        self.hedge = hedge
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.hedge_min_samples = hedge_min_samples
+        self.validate = validate
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+
+    def hedge_delay(self, provider: LLMProvider) -> float:
+        stats = self.provider_stats[provider.name]
+        if len(stats.latencies) < self.hedge_min_samples:
+            return self.hedge_delay_seconds
+        return stats.percentile(0.95)
+
+    def _available(self) -> List[LLMProvider]:
+        available = [provider for provider in self.providers if self.breakers[provider.name].can_try()]
+        if not available:
+            self.short_circuited += 1
+            raise LLMUnavailable("All LLM providers are unavailable (circuit breakers open)")
+        return available
+
+    async def _attempt(self, provider: LLMProvider, prompt: str, timeout: float) -> str:
+        breaker = self.breakers[provider.name]
+        start = time.perf_counter()
+        try:
+            text = await provider.complete(prompt, timeout)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the provider's health
+            self.provider_stats[provider.name].record("cancelled", time.perf_counter() - start)
+            breaker.trial_in_flight = False
+            raise
+        except Exception:
+            self.provider_stats[provider.name].record("failure", time.perf_counter() - start)
+            breaker.record_failure()
+            raise
+        # An unusable answer still shows the provider is up, so it does not trip the breaker
+        breaker.record_success()
+        if not self.validate(text):
+            self.provider_stats[provider.name].record("invalid", time.perf_counter() - start)
+            raise InvalidLLMResponse(text)
+        self.provider_stats[provider.name].record("ok", time.perf_counter() - start)
+        return text
+
+    async def complete(self, prompt: str, timeout: float) -> str:
+        candidates = self._available()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        pending = set()
+        hedge_tasks = set()
+        launched = 0
+        hedge_at = None
+        last_error: Optional[Exception] = LLMUnavailable("All LLM providers are unavailable (circuit breakers open)")
+        invalid_text: Optional[str] = None
+        
+        def launch() -> Optional[asyncio.Task]:
+            nonlocal launched, hedge_at
+            while launched < len(candidates):
+                provider = candidates[launched]
+                launched += 1
+                if not self.breakers[provider.name].allow():
+                    continue  # Another call took its half-open trial meanwhile
+                task = asyncio.create_task(self._attempt(provider, prompt, max(deadline - loop.time(), 0.001)))
+                pending.add(task)
+                hedge_at = loop.time() + self.hedge_delay(provider) if self.hedge else None
+                return task
+            return None
+        
+        launch()
+        try:
+            while pending:
+                can_hedge = hedge_at is not None and launched < len(candidates)
+                wait_timeout = max(hedge_at - loop.time(), 0) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    error = task.exception()
+                    if error is None:
+                        if task in hedge_tasks:
+                            self.hedge_wins += 1
+                        return task.result()
+                    if isinstance(error, InvalidLLMResponse):
+                        invalid_text = str(error)
+                    else:
+                        last_error = error
+                if launched < len(candidates):
+                    if not pending:
+                        launch()  # Fail over immediately
+                    elif can_hedge and loop.time() >= hedge_at:
+                        task = launch()
+                        if task is not None:
+                            self.hedged += 1
+                            hedge_tasks.add(task)
+        finally:
+            for task in pending:
+                task.cancel()
+        # Nothing valid: hand back an unusable answer for repair/fallback, else the last error
+        if invalid_text is not None:
+            return invalid_text
+        raise last_error
+
+    async def stream(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        """Stream from the first available provider; falls over only if it fails before producing text"""
+        candidates = self._available()
+        last_error: Exception = LLMUnavailable("All LLM providers are unavailable (circuit breakers open)")
+        for provider in candidates:
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                continue
+            start = time.perf_counter()
+            received = False
+            try:
+                async for piece in provider.stream(prompt, timeout):
+                    received = True
+                    yield piece
+            except (GeneratorExit, asyncio.CancelledError):
+                breaker.trial_in_flight = False
+                raise
+            except Exception as e:
+                self.provider_stats[provider.name].record("failure", time.perf_counter() - start)
+                breaker.record_failure()
+                if received:
+                    raise
+                last_error = e
+                continue
+            breaker.record_success()
+            self.provider_stats[provider.name].record("ok", time.perf_counter() - start)
+            return
+        raise last_error
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedging": self.hedge,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "short_circuited": self.short_circuited,
+            "providers": {
+                provider.name: {
+                    "model": provider.model,
+                    "circuit": self.breakers[provider.name].state,
+                    "times_opened": self.breakers[provider.name].times_opened,
+                    "hedge_delay_seconds": round(self.hedge_delay(provider), 4),
+                    **self.provider_stats[provider.name].stats()
+                }
+                for provider in self.providers
+            }
+        }
+
+class LLMClient:
+    """Calls a provider with a global concurrency cap, per-call deadlines and jittered retries"""
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        max_concurrency: int,
+        timeout: float,
+        deadline: float,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float
+    ):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff so concurrent retries do not line up"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _acquire(self, deadline: float):
+        """Take a concurrency slot; waiting for one counts against the call's deadline"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded(f"{self.provider.name} call exceeded {self.deadline:g}s deadline")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=remaining)
+        except asyncio.TimeoutError:
+            raise LLMDeadlineExceeded(f"{self.provider.name} call exceeded {self.deadline:g}s deadline waiting for a slot")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.attempts += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, google_exceptions.DeadlineExceeded)):
+            self.timeouts += 1
+        if attempt >= self.max_retries:
+            return False
+        logger.warning(f"{self.provider.name} call failed ({type(error).__name__}), retrying")
+        return True
+
+    async def complete(self, prompt: str) -> str:
+        """Return the provider's response text, retrying transient errors until the deadline"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.deadline
+        self.calls += 1
+        attempt = 0
+        try:
+            while True:
+                await self._acquire(deadline)
+                try:
+                    attempt_timeout = min(self.timeout, max(deadline - loop.time(), 0.001))
+                    return await asyncio.wait_for(self.provider.complete(prompt, attempt_timeout), timeout=attempt_timeout)
+                except RETRYABLE_LLM_ERRORS as e:
+                    if not self._should_retry(e, attempt):
+                        raise
+                finally:
+                    self._release()
+                # Back off outside the semaphore so waiting retries do not hold a slot
+                delay = min(self.backoff_delay(attempt), max(deadline - loop.time(), 0))
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.total_seconds += loop.time() - start
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield response text as it arrives; transient errors are only retried before the first piece
+
+        Each piece must arrive within the per-attempt timeout, and the whole stream within the deadline.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.deadline
+        self.calls += 1
+        attempt = 0
+        try:
+            while True:
+                await self._acquire(deadline)
+                received = False
+                try:
+                    pieces = self.provider.stream(prompt, min(self.timeout, max(deadline - loop.time(), 0.001))).__aiter__()
+                    while True:
+                        piece_timeout = min(self.timeout, max(deadline - loop.time(), 0.001))
+                        try:
+                            piece = await asyncio.wait_for(pieces.__anext__(), timeout=piece_timeout)
+                        except StopAsyncIteration:
+                            return
+                        received = True
+                        yield piece
+                except RETRYABLE_LLM_ERRORS as e:
+                    # Text already forwarded cannot be taken back, so only a silent failure is retried
+                    if received or not self._should_retry(e, attempt):
+                        raise
+                finally:
+                    self._release()
+                delay = min(self.backoff_delay(attempt), max(deadline - loop.time(), 0))
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.total_seconds += loop.time() - start
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider.name,
+            "model": self.provider.model,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "average_seconds": round(self.total_seconds / self.calls, 4) if self.calls else 0.0,
+            **self.provider.stats()
+        }
+
+def create_llm_client() -> Optional[LLMClient]:
+    """Build the LLM client over every configured provider, behind a router"""
+    names = LLM_PROVIDERS or [name for name, key in (("openai", OPENAI_API_KEY), ("gemini", GEMINI_API_KEY)) if key]
+    providers: List[LLMProvider] = []
+    for name in names:
+        if name == "openai" and OPENAI_API_KEY:
+            providers.append(OpenAIProvider(OPENAI_API_KEY, OPENAI_MODEL, OPENAI_BASE_URL))
+            logger.info(f"OpenAI client initialized successfully{f' ({OPENAI_BASE_URL})' if OPENAI_BASE_URL else ''}")
+        elif name == "gemini" and GEMINI_API_KEY:
+            providers.append(GeminiProvider(GEMINI_API_KEY, GEMINI_MODEL))
+            logger.info("Gemini client initialized successfully")
+        elif name == "stub":
+            providers.append(StubProvider(LLM_STUB_LATENCY_SECONDS, LLM_STUB_ERROR_RATE))
+            logger.info("Stub LLM provider enabled")
+        else:
+            logger.warning(f"LLM provider '{name}' is unknown or has no API key; skipping")
+    if not providers:
+        logger.warning("No OpenAI or Gemini API key found. AI features will be limited.")
+        return None
+    router = ProviderRouter(
+        providers,
+        breaker_failures=LLM_BREAKER_FAILURES,
+        breaker_reset_seconds=LLM_BREAKER_RESET_SECONDS,
+        hedge=LLM_HEDGE,
+        hedge_delay_seconds=LLM_HEDGE_DELAY_SECONDS,
+        hedge_min_samples=LLM_HEDGE_MIN_SAMPLES
+    )
+    return LLMClient(
+        router,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        timeout=LLM_TIMEOUT_SECONDS,
+        deadline=LLM_DEADLINE_SECONDS,
+        max_retries=LLM_MAX_RETRIES,
+        backoff_base=LLM_BACKOFF_BASE_SECONDS,
+        backoff_max=LLM_BACKOFF_MAX_SECONDS
+    )
+
+llm_client = create_llm_client()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    if llm_client is not None:
+        await llm_client.aclose()
 
 # User authentication functions
 def hash_password(password: str) -> str:
@@ -176,93 +971,693 @@ def generate_token() -> str:
     """Generate a random token"""
     return secrets.token_urlsafe(32)
 
-def create_users_csv_if_not_exists():
-    """Create users.csv file if it doesn't exist"""
-    if not os.path.exists(USERS_CSV_FILE):
-        with open(USERS_CSV_FILE, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['username', 'email', 'password_hash', 'full_name', 'created_at', 'last_login'])
-
-def save_user_to_csv(user_data: dict):
-    """Save user data to CSV file"""
-    create_users_csv_if_not_exists()
-    with open(USERS_CSV_FILE, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([
-            user_data['username'],
-            user_data['email'],
-            user_data['password_hash'],
-            user_data['full_name'],
-            user_data['created_at'],
-            user_data['last_login']
-        ])
+USER_FIELDS = ['username', 'email', 'password_hash', 'full_name', 'created_at', 'last_login']
 
-def get_user_by_username(username: str) -> Optional[dict]:
-    """Get user data by username from CSV"""
-    create_users_csv_if_not_exists()
-    with open(USERS_CSV_FILE, 'r', newline='') as file:
+class UserAlreadyExists(Exception):
+    """A username or email is already registered; `field` says which"""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already exists")
+        self.field = field
+
+class UserRepository:
+    """Storage for user records (dicts with USER_FIELDS as string values)"""
+    name = "base"
+
+    def __init__(self):
+        self.lookups = 0
+        self.inserts = 0
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def add(self, user: dict):
+        """Insert a user, raising UserAlreadyExists on a duplicate username or email"""
+        error = self.add_many([user])[0]
+        if error is not None:
+            raise error
+
+    def add_many(self, users: List[dict]) -> List[Optional[Exception]]:
+        """Insert users in one durable commit; returns None or the error (UserAlreadyExists for duplicates) for each"""
+        raise NotImplementedError
+
+    def update_last_logins(self, updates: Dict[str, str]):
+        """Set last_login for many users in one write; unknown usernames are ignored"""
+        raise NotImplementedError
+
+    def list_users(self, after: Optional[str], limit: int) -> List[dict]:
+        """Up to `limit` users ordered by username, starting after the given username"""
+        raise NotImplementedError
+
+    def iter_users(self, after: Optional[str] = None) -> Iterator[dict]:
+        """Every user in username order, read a page at a time"""
+        while True:
+            users = self.list_users(after, 500)
+            yield from users
+            if len(users) < 500:
+                return
+            after = users[-1]['username']
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "users": self.count(), "lookups": self.lookups, "inserts": self.inserts}
+
+class CSVUserRepository(UserRepository):
+    """users.csv with in-memory username/email indexes, rebuilt when the file changes on disk"""
+    name = "csv"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.reloads = 0
+        self._by_username: Dict[str, dict] = {}
+        self._by_email: Dict[str, dict] = {}
+        self._sorted_usernames: Optional[List[str]] = None
+        self._signature = None
+        self._lock = threading.RLock()
+        if not os.path.exists(path):
+            with open(path, 'w', newline='') as file:
+                csv.writer(file).writerow(USER_FIELDS)
+
+    def _file_signature(self) -> tuple:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        """Reload the indexes if another process (or an editor) changed the file"""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        by_username, by_email = {}, {}
+        with open(self.path, 'r', newline='') as file:
+            for row in csv.DictReader(file):
+                # First occurrence wins, matching the old top-to-bottom scans
+                by_username.setdefault(row['username'], row)
+                by_email.setdefault(row['email'], row)
+        self._by_username, self._by_email = by_username, by_email
+        self._sorted_usernames = None
+        self._signature = signature
+        self.reloads += 1
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            self.lookups += 1
+            user = self._by_username.get(username)
+            return dict(user) if user else None
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            self.lookups += 1
+            user = self._by_email.get(email)
+            return dict(user) if user else None
+
+    def add_many(self, users: List[dict]) -> List[Optional[Exception]]:
+        with self._lock:
+            self._refresh()
+            results, rows = [], []
+            for user in users:
+                if user['username'] in self._by_username:
+                    results.append(UserAlreadyExists("Username"))
+                    continue
+                if user['email'] in self._by_email:
+                    results.append(UserAlreadyExists("Email"))
+                    continue
+                row = {field: user.get(field) or '' for field in USER_FIELDS}
+                self._by_username[row['username']] = row
+                self._by_email[row['email']] = row
+                self._sorted_usernames = None
+                rows.append(row)
+                results.append(None)
+            if rows:
+                with open(self.path, 'a', newline='') as file:
+                    csv.DictWriter(file, fieldnames=USER_FIELDS).writerows(rows)
+                    file.flush()
+                    os.fsync(file.fileno())
+                self._signature = self._file_signature()
+                self.inserts += len(rows)
+            return results
+
+    def update_last_logins(self, updates: Dict[str, str]):
+        # Holding the lock across the rewrite keeps concurrent add() appends from being lost
+        with self._lock:
+            self._refresh()
+            changed = False
+            for username, timestamp in updates.items():
+                if username in self._by_username:
+                    self._by_username[username]['last_login'] = timestamp
+                    changed = True
+            if not changed:
+                return
+            # Write a sibling temp file and swap it in, so readers never see a half-written file
+            fd, temp_path = tempfile.mkstemp(prefix=".users_", suffix=".csv", dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                with os.fdopen(fd, 'w', newline='') as file:
+                    writer = csv.DictWriter(file, fieldnames=USER_FIELDS)
+                    writer.writeheader()
+                    writer.writerows(self._by_username.values())
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            self._signature = self._file_signature()
+
+    def list_users(self, after: Optional[str], limit: int) -> List[dict]:
+        with self._lock:
+            self._refresh()
+            if self._sorted_usernames is None:
+                self._sorted_usernames = sorted(self._by_username)
+            start = bisect.bisect_right(self._sorted_usernames, after) if after is not None else 0
+            return [dict(self._by_username[username]) for username in self._sorted_usernames[start:start + limit]]
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._by_username)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "reloads": self.reloads}
+
+class SQLiteUserRepository(UserRepository):
+    """SQLite table with unique indexes on username and email, so lookups are B-tree searches"""
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL syncs the WAL on every commit, so a committed registration survives a power loss
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, email TEXT NOT NULL, "
+            "password_hash TEXT NOT NULL, full_name TEXT NOT NULL, created_at TEXT NOT NULL, last_login TEXT)"
+        )
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username)")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_email ON users (email)")
+
+    @staticmethod
+    def _row_to_user(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        return {field: row[field] if row[field] is not None else '' for field in USER_FIELDS}
+
+    def _fetch_one(self, column: str, value: str) -> Optional[dict]:
+        with self._lock:
+            self.lookups += 1
+            row = self._conn.execute(f"SELECT * FROM users WHERE {column} = ?", (value,)).fetchone()
+        return self._row_to_user(row)
+
+    def get_by_username(self, username: str) -> Optional[dict]:
+        return self._fetch_one("username", username)
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        return self._fetch_one("email", email)
+
+    def add_many(self, users: List[dict]) -> List[Optional[Exception]]:
+        results = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for user in users:
+                    # A failed INSERT only undoes itself; the rest of the batch still commits
+                    try:
+                        self._conn.execute(
+                            "INSERT INTO users (username, email, password_hash, full_name, created_at, last_login) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            tuple(user.get(field) for field in USER_FIELDS[:-1]) + (user.get('last_login') or None,)
+                        )
+                        results.append(None)
+                    except sqlite3.IntegrityError as e:
+                        results.append(self._integrity_error(e))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.inserts += results.count(None)
+        return results
+
+    @staticmethod
+    def _integrity_error(error: sqlite3.IntegrityError) -> Exception:
+        """Only unique-index violations are duplicates; anything else (e.g. NOT NULL) is a real error"""
+        message = str(error)
+        if message == "UNIQUE constraint failed: users.username":
+            return UserAlreadyExists("Username")
+        if message == "UNIQUE constraint failed: users.email":
+            return UserAlreadyExists("Email")
+        return error
+
+    def update_last_logins(self, updates: Dict[str, str]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE users SET last_login = ? WHERE username = ?",
+                    [(timestamp, username) for username, timestamp in updates.items()]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def list_users(self, after: Optional[str], limit: int) -> List[dict]:
+        # Keyset pagination seeks into the username index instead of OFFSET-scanning
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM users WHERE username > ? ORDER BY username LIMIT ?", (after or "", limit)
+            ).fetchall()
+        return [self._row_to_user(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def sqlite_path_from_url(url: str) -> str:
+    """sqlite:///users.db -> users.db, sqlite:////var/data/users.db -> /var/data/users.db"""
+    prefix = "sqlite:///"
+    if not url.startswith(prefix):
+        raise ValueError(f"Unsupported DATABASE_URL (only sqlite:/// is supported): {url}")
+    return url[len(prefix):] or ":memory:"
+
+def import_users_from_csv(csv_path: str, repository: UserRepository) -> tuple:
+    """Copy users from a users.csv into a repository; returns (imported, skipped duplicates)"""
+    imported = skipped = 0
+    with open(csv_path, 'r', newline='') as file:
         reader = csv.DictReader(file)
-        for row in reader:
-            if row['username'] == username:
-                return row
-    return None
+        while True:
+            batch = [row for _, row in zip(range(500), reader)]
+            if not batch:
+                break
+            results = repository.add_many(batch)
+            for row, error in zip(batch, results):
+                if error is not None and not isinstance(error, UserAlreadyExists):
+                    raise ValueError(f"Cannot import user {row.get('username')!r}: {error}") from error
+            skipped += sum(1 for error in results if error is not None)
+            imported += results.count(None)
+    return imported, skipped
+
+def create_user_repository(store: str) -> UserRepository:
+    """Build the user store named by USER_STORE"""
+    if store == "csv":
+        return CSVUserRepository(USERS_CSV_FILE)
+    if store == "sqlite":
+        path = sqlite_path_from_url(DATABASE_URL)
+        is_new = path == ":memory:" or not os.path.exists(path)
+        repository = SQLiteUserRepository(path)
+        # First start on SQLite: carry over the accounts registered while users.csv was the store
+        if is_new and os.path.exists(USERS_CSV_FILE):
+            imported, skipped = import_users_from_csv(USERS_CSV_FILE, repository)
+            logger.info(f"Imported {imported} users from {USERS_CSV_FILE} into {path} ({skipped} duplicates skipped)")
+        return repository
+    raise ValueError(f"Unknown user store: {store}")
+
+user_repository = create_user_repository(USER_STORE)
+
+class LastLoginBuffer:
+    """Write-behind buffer for login timestamps, flushed to the user store in batches
+
+    Logins only touch memory; a background task writes the latest timestamp per user
+    every LAST_LOGIN_FLUSH_SECONDS, and once more on shutdown.
+    """
+
+    def __init__(self, repository: UserRepository, flush_seconds: float):
+        self.repository = repository
+        self.flush_seconds = flush_seconds
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.errors = 0
+        self.last_flush_seconds = 0.0
+        self._pending: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, username: str, timestamp: str):
+        with self._lock:
+            self._pending[username] = timestamp
+            self.recorded += 1
+
+    def flush(self):
+        """Write everything buffered so far; failed batches are kept for the next flush"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            start = time.perf_counter()
+            try:
+                self.repository.update_last_logins(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} login timestamps: {e}")
+                self.errors += 1
+                with self._lock:
+                    # Newer logins recorded during the failed write win
+                    self._pending = {**batch, **self._pending}
+                return
+            self.last_flush_seconds = time.perf_counter() - start
+            self.flushes += 1
+            self.flushed += len(batch)
+        for username in batch:
+            user_cache.invalidate(username)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await asyncio.to_thread(self.flush)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "errors": self.errors,
+            "last_flush_seconds": self.last_flush_seconds
+        }
+
+last_login_buffer = LastLoginBuffer(user_repository, LAST_LOGIN_FLUSH_SECONDS)
+
+class RegistrationWriter:
+    """Single writer task that group-commits registrations to the user store
+
+    Callers are checked against an in-memory username/email index (loaded from the
+    store on first use), which also reserves their names so a concurrent duplicate is
+    rejected without touching storage. Queued users are committed in batches with one
+    fsync, and each caller's future resolves once its batch is durable.
+    """
+
+    def __init__(self, repository: UserRepository, batch_max: int, batch_wait_seconds: float):
+        self.repository = repository
+        self.batch_max = batch_max
+        self.batch_wait_seconds = batch_wait_seconds
+        self.batches = 0
+        self.committed = 0
+        self.rejected = 0
+        self.largest_batch = 0
+        self.commit_seconds = 0.0
+        self._usernames: Optional[set] = None
+        self._emails: Optional[set] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _ensure_started(self):
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self._usernames is None:
+                users = await asyncio.to_thread(lambda: [(user['username'], user['email']) for user in self.repository.iter_users()])
+                self._usernames = {username for username, _ in users}
+                self._emails = {email for _, email in users}
+            if self._task is None:
+                self._queue = asyncio.Queue()
+                self._task = asyncio.create_task(self._run())
+
+    def _release(self, user: dict):
+        self._usernames.discard(user['username'])
+        self._emails.discard(user['email'])
+
+    async def register(self, user: dict):
+        """Durably add a user, raising UserAlreadyExists on a duplicate username or email"""
+        await self._ensure_started()
+        if user['username'] in self._usernames:
+            self.rejected += 1
+            raise UserAlreadyExists("Username")
+        if user['email'] in self._emails:
+            self.rejected += 1
+            raise UserAlreadyExists("Email")
+        self._usernames.add(user['username'])
+        self._emails.add(user['email'])
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user, future))
+        await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Linger briefly so a burst shares one commit
+            deadline = time.monotonic() + self.batch_wait_seconds
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            await self._commit(batch)
+
+    async def _commit(self, batch: List[tuple]):
+        start = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self.repository.add_many, [user for user, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to commit {len(batch)} registrations: {e}")
+            results = [e] * len(batch)
+        self.commit_seconds += time.perf_counter() - start
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (user, future), error in zip(batch, results):
+            if error is None:
+                self.committed += 1
+                if not future.done():
+                    future.set_result(None)
+                continue
+            # Rejected by the store itself: drop the reservation, keeping only names
+            # the store confirms are taken (e.g. another process registered them first)
+            self._release(user)
+            if isinstance(error, UserAlreadyExists):
+                await self._reserve_existing(user)
+            self.rejected += 1
+            if not future.done():
+                future.set_exception(error)
+
+    async def _reserve_existing(self, user: dict):
+        try:
+            by_username, by_email = await asyncio.to_thread(
+                lambda: (self.repository.get_by_username(user['username']), self.repository.get_by_email(user['email']))
+            )
+        except Exception as e:
+            logger.error(f"Failed to re-check {user['username']} after a rejected registration: {e}")
+            return
+        if by_username is not None:
+            self._usernames.add(user['username'])
+        if by_email is not None:
+            self._emails.add(user['email'])
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "committed": self.committed,
+            "rejected": self.rejected,
+            "largest_batch": self.largest_batch,
+            "average_batch": self.committed / self.batches if self.batches else None,
+            "average_commit_seconds": self.commit_seconds / self.batches if self.batches else None
+        }
+
+registration_writer = RegistrationWriter(user_repository, REGISTRATION_BATCH_MAX, REGISTRATION_BATCH_WAIT_MS / 1000)
+
+@app.on_event("startup")
+async def start_last_login_flusher():
+    last_login_buffer.start()
+
+@app.on_event("shutdown")
+async def close_user_repository():
+    await registration_writer.stop()
+    await last_login_buffer.stop()
+    user_repository.close()
+
+def get_user_by_username(username: str) -> Optional[dict]:
+    """Get user data by username"""
+    return user_repository.get_by_username(username)
 
 def get_user_by_email(email: str) -> Optional[dict]:
-    """Get user data by email from CSV"""
-    create_users_csv_if_not_exists()
-    with open(USERS_CSV_FILE, 'r', newline='') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row['email'] == email:
-                return row
-    return None
+    """Get user data by email"""
+    return user_repository.get_by_email(email)
 
 def update_user_last_login(username: str):
-    """Update user's last login timestamp"""
-    create_users_csv_if_not_exists()
-    users = []
-    with open(USERS_CSV_FILE, 'r', newline='') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row['username'] == username:
-                row['last_login'] = datetime.now().isoformat()
-            users.append(row)
-    
-    with open(USERS_CSV_FILE, 'w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=['username', 'email', 'password_hash', 'full_name', 'created_at', 'last_login'])
-        writer.writeheader()
-        writer.writerows(users)
+    """Record user's last login timestamp (written to the store by the next flush)"""
+    last_login_buffer.record(username, datetime.now().isoformat())
+
+class InvalidToken(Exception):
+    """A bearer token is malformed, forged, expired or revoked"""
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def b64url_decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4), altchars=b"-_", validate=True)
+
+class AccessTokens:
+    """Issues and verifies stateless `<payload>.<signature>` tokens signed with HMAC-SHA256
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    The payload carries the username, expiry and a random id; revoked ids are kept
+    in memory until their token would have expired anyway.
+    """
+
+    def __init__(self, secret: str, ttl_seconds: int):
+        self._key = secret.encode()
+        self.ttl_seconds = ttl_seconds
+        self.issued = 0
+        self.verified = 0
+        self.rejected: Dict[str, int] = {}
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _sign(self, payload: str) -> str:
+        return b64url_encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, username: str) -> str:
+        claims = {"sub": username, "exp": int(time.time()) + self.ttl_seconds, "jti": generate_token()}
+        payload = b64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+        self.issued += 1
+        return f"{payload}.{self._sign(payload)}"
+
+    def _reject(self, reason: str):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise InvalidToken(reason)
+
+    def verify(self, token: str) -> dict:
+        """Return the token's claims, raising InvalidToken if it cannot be trusted"""
+        payload, _, signature = token.partition(".")
+        # Compared as bytes: compare_digest raises TypeError for non-ASCII str
+        if not signature or not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            self._reject("Invalid token")
+        try:
+            claims = json.loads(b64url_decode(payload))
+        except (ValueError, json.JSONDecodeError):
+            self._reject("Invalid token")
+        if claims.get("exp", 0) < time.time():
+            self._reject("Token expired")
+        if claims.get("jti") in self._revoked:
+            self._reject("Token revoked")
+        self.verified += 1
+        return claims
+
+    def revoke(self, claims: dict):
+        with self._lock:
+            now = time.time()
+            for jti in [jti for jti, expires in self._revoked.items() if expires < now]:
+                del self._revoked[jti]
+            self._revoked[claims["jti"]] = claims["exp"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "issued": self.issued,
+            "verified": self.verified,
+            "rejected": dict(self.rejected),
+            "revoked": len(self._revoked)
+        }
+
+class UserRecordCache:
+    """Short-lived LRU of user records so authenticated requests skip the user store"""
+
+    def __init__(self, ttl_seconds: float, max_items: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._items.get(username)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._items.move_to_end(username)
+            self.hits += 1
+            return dict(entry[1])
+
+    def set(self, username: str, user: dict):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._items[username] = (time.monotonic() + self.ttl_seconds, dict(user))
+            self._items.move_to_end(username)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._items.pop(username, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None
+        }
+
+if TOKEN_SECRET == "your-secret-key-change-in-production":
+    logger.warning("TOKEN_SECRET is not set - access tokens are signed with the default development secret")
+access_tokens = AccessTokens(TOKEN_SECRET, ACCESS_TOKEN_TTL_SECONDS)
+user_cache = UserRecordCache(USER_CACHE_TTL_SECONDS, USER_CACHE_ITEMS)
+
+def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Verify the bearer token's signature, expiry and revocation in memory"""
+    try:
+        return access_tokens.verify(credentials.credentials)
+    except InvalidToken as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+def get_current_user(claims: dict = Depends(get_token_claims)) -> dict:
     """Get current user from token"""
-    token = credentials.credentials
-    # In a real application, you would verify the token against a database
-    # For simplicity, we'll just check if the token exists in our CSV
-    # This is a basic implementation - in production, use proper JWT tokens
-    
-    create_users_csv_if_not_exists()
-    with open(USERS_CSV_FILE, 'r', newline='') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # For demo purposes, we'll use username as token
-            # In production, implement proper JWT token verification
-            if row['username'] == token:
-                return row
-    
-    raise HTTPException(status_code=401, detail="Invalid token")
+    username = claims["sub"]
+    user = user_cache.get(username)
+    if user is None:
+        user = get_user_by_username(username)
+        if user is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        user_cache.set(username, user)
+    return user
 
 # Authentication endpoints
 @app.post("/register", response_model=AuthResponse)
 async def register_user(user_data: UserRegister):
     """Register a new user"""
-    # Check if username already exists
-    if get_user_by_username(user_data.username):
-        raise HTTPException(status_code=400, detail="Username already exists")
-    
-    # Check if email already exists
-    if get_user_by_email(user_data.email):
-        raise HTTPException(status_code=400, detail="Email already exists")
-    
     # Validate input
     if len(user_data.username) < 3:
         raise HTTPException(status_code=400, detail="Username must be at least 3 characters long")
@@ -280,11 +1675,13 @@ async def register_user(user_data: UserRegister):
         'last_login': datetime.now().isoformat()
     }
     
-    # Save to CSV
-    save_user_to_csv(user_dict)
+    # Duplicates are rejected against the writer's in-memory index, then the store's own checks
+    try:
+        await registration_writer.register(user_dict)
+    except UserAlreadyExists as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Generate token (using username as token for simplicity)
-    token = user_data.username
+    token = access_tokens.issue(user_data.username)
     
     return AuthResponse(
         access_token=token,
@@ -300,7 +1697,7 @@ async def register_user(user_data: UserRegister):
 @app.post("/login", response_model=AuthResponse)
 async def login_user(user_data: UserLogin):
     """Login user"""
-    # Get user from CSV
+    # Get user from the user store
     user = get_user_by_username(user_data.username)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid username or password")
@@ -312,8 +1709,7 @@ async def login_user(user_data: UserLogin):
     # Update last login
     update_user_last_login(user_data.username)
     
-    # Generate token (using username as token for simplicity)
-    token = user_data.username
+    token = access_tokens.issue(user_data.username)
     
     return AuthResponse(
         access_token=token,
@@ -326,6 +1722,13 @@ async def login_user(user_data: UserLogin):
         )
     )
 
+@app.post("/logout")
+async def logout_user(claims: dict = Depends(get_token_claims)):
+    """Revoke the bearer token"""
+    access_tokens.revoke(claims)
+    user_cache.invalidate(claims["sub"])
+    return {"message": "Logged out"}
+
 @app.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """Get current user information"""
@@ -336,153 +1739,1323 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
         created_at=current_user['created_at']
     )
 
-@app.get("/users", response_model=List[UserResponse])
-async def get_all_users():
-    """Get all users (for admin purposes)"""
-    create_users_csv_if_not_exists()
-    users = []
-    with open(USERS_CSV_FILE, 'r', newline='') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            users.append(UserResponse(
-                username=row['username'],
-                email=row['email'],
-                full_name=row['full_name'],
-                created_at=row['created_at']
-            ))
-    return users
-
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from PDF using multiple methods"""
-    text = ""
+USER_LIST_FIELDS = list(UserResponse.model_fields)
+
+def encode_users_cursor(username: str) -> str:
+    return b64url_encode(username.encode())
+
+def decode_users_cursor(cursor: str) -> str:
+    try:
+        return b64url_decode(cursor).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/users", response_model=UserPage)
+def get_all_users(
+    limit: int = USERS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False
+):
+    """Get users (for admin purposes), a page at a time ordered by username
+
+    `fields` is a comma-separated subset of the user fields. With stream=true the
+    users from `cursor` onwards are sent as NDJSON lines while they are read.
+    """
+    selected = [field.strip() for field in fields.split(",")] if fields else USER_LIST_FIELDS
+    unknown = [field for field in selected if field not in USER_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(USER_LIST_FIELDS)})")
+    after = decode_users_cursor(cursor) if cursor else None
+    
+    if stream:
+        def user_lines():
+            for row in user_repository.iter_users(after):
+                yield json.dumps({field: row[field] for field in selected}) + "\n"
+        return StreamingResponse(user_lines(), media_type="application/x-ndjson")
+    
+    if not 1 <= limit <= USERS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {USERS_PAGE_MAX}")
+    # One extra row tells us whether another page exists
+    rows = user_repository.list_users(after, limit + 1)
+    page = rows[:limit]
+    return UserPage(
+        users=[{field: row[field] for field in selected} for row in page],
+        next_cursor=encode_users_cursor(page[-1]['username']) if len(rows) > limit else None
+    )
+
+# Blocking work executors
+class BoundedExecutor:
+    """Thread pool for blocking work with a bounded backlog and utilization counters"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the pool; rejects with 503 when the backlog is full"""
+        with self._lock:
+            if self.active + self.queued >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Server is busy processing other files, please retry shortly")
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, func, *args, **kwargs))
+
+    def _call(self, func, *args, **kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                self.busy_seconds += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self.started_at
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "utilization": round(self.active / self.max_workers, 4),
+            "average_utilization": round(self.busy_seconds / (uptime * self.max_workers), 4) if uptime > 0 else 0.0
+        }
+
+extraction_executor = BoundedExecutor("extraction", EXTRACTION_WORKERS, EXECUTOR_MAX_QUEUE)
+
+# Upload ingestion
+class IngestedUpload:
+    """An uploaded file held in memory together with its SHA-256 digest"""
+
+    def __init__(self, filename: str, ext: str, content: bytes, sha256: str):
+        self.filename = filename
+        self.ext = ext
+        self.content = content
+        self.sha256 = sha256
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+async def ingest_upload(
+    file: UploadFile,
+    allowed_exts: List[str],
+    error_detail: str,
+    max_size: Optional[int] = None
+) -> IngestedUpload:
+    """Stream an upload into memory in chunks, enforcing MAX_FILE_SIZE and hashing as it goes"""
+    max_size = MAX_FILE_SIZE if max_size is None else max_size
+    filename = file.filename or ""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in allowed_exts:
+        raise HTTPException(status_code=400, detail=error_detail)
+    
+    size_error = f"File {filename} exceeds the maximum upload size of {max_size} bytes"
+    # Reject before reading anything when the multipart part declared its size
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(status_code=413, detail=size_error)
+    
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=413, detail=size_error)
+        digest.update(chunk)
+        chunks.append(chunk)
+    
+    # A single join is the only copy; extractors wrap the bytes in BytesIO without copying again
+    return IngestedUpload(filename, ext, b"".join(chunks), digest.hexdigest())
+
+class BatchLimitExceeded(HTTPException):
+    """A batch went over BATCH_MAX_FILES or BATCH_MAX_TOTAL_BYTES; aborts the whole batch"""
+
+def ingest_zip_member(
+    archive: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    allowed_exts: List[str],
+    error_detail: str,
+    budget: Optional[int] = None
+) -> IngestedUpload:
+    """Read one archive member in chunks with the same extension, size and hashing rules as uploads
+
+    Reading stops with BatchLimitExceeded as soon as the member would use more than
+    `budget` bytes of the batch's decompressed-size allowance.
+    """
+    filename = info.filename
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in allowed_exts:
+        raise HTTPException(status_code=400, detail=error_detail)
+    # Only members that would be processed count against the batch allowance
+    budget_error = f"Batch exceeds the maximum total decompressed size of {BATCH_MAX_TOTAL_BYTES} bytes"
+    if budget is not None and info.file_size > budget:
+        raise BatchLimitExceeded(status_code=413, detail=budget_error)
+    
+    size_error = f"File {filename} exceeds the maximum upload size of {MAX_FILE_SIZE} bytes"
+    if info.file_size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=size_error)
+    
+    # The declared size can lie, so the decompressed stream is capped as well
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    try:
+        with archive.open(info) as member:
+            while True:
+                chunk = member.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if budget is not None and size > budget:
+                    raise BatchLimitExceeded(status_code=413, detail=budget_error)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail=size_error)
+                digest.update(chunk)
+                chunks.append(chunk)
+    except (RuntimeError, NotImplementedError, zipfile.BadZipFile) as e:
+        # Encrypted members, unsupported compression methods and corrupt data (bad CRC)
+        reason = "it is encrypted" if info.flag_bits & 0x1 else str(e)
+        raise HTTPException(status_code=400, detail=f"Cannot read {filename} from the archive: {reason}")
+    return IngestedUpload(filename, ext, b"".join(chunks), digest.hexdigest())
+
+def extract_upload_text(upload: IngestedUpload) -> str:
+    """Extract text from an ingested PDF or image upload"""
+    if upload.ext == '.pdf':
+        return extract_text_from_pdf_cached(upload.content, upload.sha256)
+    # For images, use OCR directly
+    return extract_text_from_image(upload.content)
+
+# Extraction cache
+class MemoryLRUCache:
+    """In-process LRU cache of string values"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"items": len(self._items), "max_items": self.max_items}
+
+class DiskCache:
+    """Size-bounded on-disk cache of string values, evicting least recently used files first"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".txt")
+
+    def _entries(self) -> List[tuple]:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".txt"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                value = file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # Touch the file so eviction order follows access, not creation
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: str):
+        data = value.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "items": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
+
+class TieredCache:
+    """Memory LRU tier in front of an optional disk tier, with hit/miss counters"""
+
+    def __init__(self, memory: MemoryLRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except OSError as e:
+                logger.warning(f"Could not write disk cache entry: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
+
+extraction_cache = TieredCache(
+    MemoryLRUCache(EXTRACTION_CACHE_MEMORY_ITEMS),
+    DiskCache(EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_DISK_BYTES) if EXTRACTION_CACHE_DISK_BYTES > 0 else None
+)
+
+page_cache = TieredCache(
+    MemoryLRUCache(PAGE_CACHE_MEMORY_ITEMS),
+    DiskCache(PAGE_CACHE_DIR, PAGE_CACHE_DISK_BYTES) if PAGE_CACHE_DISK_BYTES > 0 else None
+)
+
+class LLMResultCache:
+    """Caches parsed LLM analyses with a TTL, tracking hit rate and the provider latency saved"""
+
+    def __init__(self, cache: TieredCache, ttl_seconds: int):
+        self.cache = cache
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(task: str, text: str, prompt_version: str, provider: str, model: str) -> str:
+        normalized = " ".join(text.split())
+        text_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        return f"llm:{task}:{prompt_version}:{provider}:{model}:{text_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.ttl_seconds <= 0:
+            return None
+        value = self.cache.get(key)
+        entry = json.loads(value) if value is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry["created_at"] > self.ttl_seconds:
+                self.expired += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry["seconds"]
+        return entry["result"]
+
+    def set(self, key: str, result: Dict[str, Any], seconds: float):
+        if self.ttl_seconds <= 0:
+            return
+        self.cache.set(key, json.dumps({"created_at": time.time(), "seconds": seconds, "result": result}))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "ttl_seconds": self.ttl_seconds,
+            "backend": self.cache.stats()
+        }
+
+llm_result_cache = LLMResultCache(
+    TieredCache(
+        MemoryLRUCache(LLM_CACHE_MEMORY_ITEMS),
+        DiskCache(LLM_CACHE_DIR, LLM_CACHE_DISK_BYTES) if LLM_CACHE_DISK_BYTES > 0 else None
+    ),
+    LLM_CACHE_TTL_SECONDS
+)
+
+def page_fingerprint(page: PyPDF2.PageObject) -> str:
+    """Hash a page's content streams, page geometry and the XObjects (images, forms) it draws
+
+    Scanned pages share near-identical content streams ("draw image Im0"), so the
+    XObject data must be part of the fingerprint for OCR'd pages to be told apart.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((page.get("/MediaBox"), page.get("/Rotate"))).encode())
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects.keys()):
+            xobject = xobjects[name].get_object()
+            digest.update(name.encode())
+            digest.update(getattr(xobject, "_data", b"") or b"")
+    return digest.hexdigest()
+
+def page_cache_key(fingerprint: str) -> str:
+    return f"page:{fingerprint}:{EXTRACTOR_VERSION}"
+
+def extraction_cache_key(sha256: str) -> str:
+    """Cache key for an uploaded file: content hash plus extractor version"""
+    return f"pdf:{sha256}:{EXTRACTOR_VERSION}"
+
+def extract_text_from_pdf_cached(pdf_data: bytes, sha256: str) -> str:
+    """Extract text from PDF, reusing the result of an earlier identical upload"""
+    key = extraction_cache_key(sha256)
+    text = extraction_cache.get(key)
+    if text is not None:
+        return text
+    text = extract_text_from_pdf(pdf_data)
+    # Don't cache failed extractions, they may succeed on retry
+    if text.strip():
+        extraction_cache.set(key, text)
+    return text
+
+def extract_pdf_pages(pdf_data: bytes, ocr_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Extract text page by page: use the text layer where present, OCR only pages without one"""
+    pages = []
+    try:
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+        page_count = len(pdf_reader.pages)
+    except Exception as e:
+        logger.error(f"Error reading PDF text layer: {e}")
+        pdf_reader = None
+        with pdfplumber.open(io.BytesIO(pdf_data)) as pdf:
+            page_count = len(pdf.pages)
+    
+    # pdfplumber is only opened if some page has no usable PyPDF2 text
+    plumber_pdf = None
+    try:
+        for page_index in range(page_count):
+            start = time.perf_counter()
+            fingerprint = None
+            if pdf_reader is not None:
+                try:
+                    fingerprint = page_fingerprint(pdf_reader.pages[page_index])
+                except Exception as e:
+                    logger.warning(f"Could not fingerprint page {page_index + 1}: {e}")
+            
+            # Unchanged pages of a re-issued PDF come straight from the page cache
+            cached = page_cache.get(page_cache_key(fingerprint)) if fingerprint else None
+            if cached is not None:
+                cached_page = json.loads(cached)
+                pages.append({
+                    "page": page_index + 1,
+                    "method": "cache",
+                    "source_method": cached_page["method"],
+                    "text": cached_page["text"],
+                    "fingerprint": fingerprint,
+                    "seconds": time.perf_counter() - start
+                })
+                continue
+            
+            text = ""
+            method = "ocr"
+            if pdf_reader is not None:
+                try:
+                    text = pdf_reader.pages[page_index].extract_text() or ""
+                    method = "text"
+                except Exception as e:
+                    logger.warning(f"PyPDF2 failed on page {page_index + 1}: {e}")
+            if len(text.strip()) < MIN_PAGE_TEXT_CHARS:
+                try:
+                    if plumber_pdf is None:
+                        plumber_pdf = pdfplumber.open(io.BytesIO(pdf_data))
+                    plumber_text = plumber_pdf.pages[page_index].extract_text() or ""
+                except Exception as e:
+                    logger.warning(f"pdfplumber failed on page {page_index + 1}: {e}")
+                    plumber_text = ""
+                if len(plumber_text.strip()) >= MIN_PAGE_TEXT_CHARS:
+                    text, method = plumber_text, "pdfplumber"
+                else:
+                    method = "ocr"
+            pages.append({
+                "page": page_index + 1,
+                "method": method,
+                "text": text,
+                "fingerprint": fingerprint,
+                "seconds": time.perf_counter() - start
+            })
+    finally:
+        if plumber_pdf is not None:
+            plumber_pdf.close()
+    
+    # Rasterize and OCR only the pages without a usable text layer
+    ocr_indexes = [page["page"] - 1 for page in pages if page["method"] == "ocr"]
+    if ocr_indexes:
+        try:
+            ocr_results = run_ocr_on_pages(pdf_data, ocr_indexes, ocr_workers)
+        except Exception as e:
+            logger.error(f"Error in OCR extraction: {e}")
+            ocr_results = [("", 0.0)] * len(ocr_indexes)
+        for page_index, (page_text, seconds) in zip(ocr_indexes, ocr_results):
+            pages[page_index]["text"] = page_text
+            pages[page_index]["seconds"] += seconds
+    
+    cached_count = 0
+    for page in pages:
+        page["chars"] = len(page["text"].strip())
+        page["seconds"] = round(page["seconds"], 4)
+        if page["method"] == "cache":
+            cached_count += 1
+        elif page["fingerprint"] and page["chars"]:
+            page_cache.set(page_cache_key(page["fingerprint"]), json.dumps({"method": page["method"], "text": page["text"]}))
+    logger.info(
+        f"Extracted {page_count} pages "
+        f"({page_count - len(ocr_indexes) - cached_count} text layer, {len(ocr_indexes)} OCR, {cached_count} cached) "
+        f"in {sum(page['seconds'] for page in pages):.2f}s"
+    )
+    return pages
+
+def extract_text_from_pdf(pdf_data: bytes) -> str:
+    """Extract text from PDF, choosing text layer or OCR per page"""
+    try:
+        pages = extract_pdf_pages(pdf_data)
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}")
+        return ""
+    return "".join(page["text"] + "\n" for page in pages)
+
+def extract_text_from_image(image_data: bytes) -> str:
+    """Extract text from an uploaded image using OCR"""
+    img = Image.open(io.BytesIO(image_data))
+    return get_ocr_engine().image_to_string(img)
+
+_ocr_process_pools: Dict[int, ProcessPoolExecutor] = {}
+_ocr_process_pools_lock = threading.Lock()
+
+def get_ocr_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared OCR process pool for this worker count, creating it on first use"""
+    with _ocr_process_pools_lock:
+        pool = _ocr_process_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(OCR_START_METHOD),
+                initializer=reset_ocr_engine
+            )
+            _ocr_process_pools[workers] = pool
+        return pool
+
+def discard_ocr_process_pool(workers: int, pool: ProcessPoolExecutor):
+    """Forget a broken OCR process pool so the next call starts a fresh one"""
+    with _ocr_process_pools_lock:
+        if _ocr_process_pools.get(workers) is pool:
+            del _ocr_process_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def split_page_ranges(page_numbers: List[int], parts: int) -> List[List[int]]:
+    """Split page numbers into at most `parts` contiguous, evenly sized ranges"""
+    parts = max(1, min(parts, len(page_numbers)))
+    size, remainder = divmod(len(page_numbers), parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < remainder else 0)
+        ranges.append(page_numbers[start:end])
+        start = end
+    return ranges
+
+def run_ocr_on_pages(
+    pdf_data: bytes,
+    page_numbers: List[int],
+    workers: Optional[int] = None,
+    config: Optional[OCRPreprocessConfig] = None
+) -> List[tuple]:
+    """OCR the given pages, spreading them across the OCR process pool when worthwhile"""
+    workers = OCR_WORKERS if workers is None else workers
+    if workers <= 1 or len(page_numbers) <= 1:
+        return ocr_pdf_pages(pdf_data, page_numbers, config)
+    
+    # Each worker receives the PDF bytes once and OCRs a contiguous range of pages;
+    # map() returns the ranges in submission order so page order is kept
+    page_ranges = split_page_ranges(page_numbers, workers)
+    pool = get_ocr_process_pool(workers)
+    results = []
+    try:
+        for range_results in pool.map(ocr_pdf_pages, [pdf_data] * len(page_ranges), page_ranges, [config] * len(page_ranges)):
+            results.extend(range_results)
+    except BrokenProcessPool as e:
+        # A worker died (out of memory, or an exception that could not be sent back); replace
+        # the pool and OCR this document in-process, which also surfaces the underlying error
+        logger.error(f"OCR process pool broke, OCRing {len(page_numbers)} pages in-process: {e}")
+        discard_ocr_process_pool(workers, pool)
+        return ocr_pdf_pages(pdf_data, page_numbers, config)
+    return results
+
+def extract_text_with_ocr(
+    pdf_data: bytes,
+    workers: Optional[int] = None,
+    config: Optional[OCRPreprocessConfig] = None
+) -> str:
+    """Extract text using OCR for every page of an image-based PDF"""
+    try:
+        pdf = pdfium.PdfDocument(pdf_data)
+        page_count = len(pdf)
+        pdf.close()
+        results = run_ocr_on_pages(pdf_data, list(range(page_count)), workers, config)
+        return "".join(page_text + "\n" for page_text, _ in results)
+    except Exception as e:
+        logger.error(f"Error in OCR extraction: {e}")
+        return ""
+
+class LLMRepairStats:
+    """Counts how LLM replies were parsed and how much of them had to be repaired"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, count: int = 1):
+        if count:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + count
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters)
+
+llm_repair_stats = LLMRepairStats()
+
+CALENDAR_EVENT_TYPES = {"lecture", "tutorial", "lab", "exam", "holiday", "other"}
+DATE_FORMATS = ["%Y-%m-%d", "%d %B %Y", "%d %b %Y", "%B %d %Y", "%b %d %Y", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d"]
+
+def coerce_date(value: Any) -> Optional[str]:
+    """Normalize "2 June 2025 (Monday)", "June 2nd, 2025", "02/06/2025"... to YYYY-MM-DD"""
+    if not isinstance(value, str):
+        return None
+    cleaned = re.sub(r"\([^)]*\)", "", value)
+    cleaned = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", cleaned).replace(",", " ")
+    cleaned = " ".join(cleaned.split())
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(cleaned, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+def coerce_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r"-?\d+", value) if isinstance(value, str) else None
+    return int(match.group()) if match else None
+
+def coerce_weekday(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    prefix = value.strip().lower()[:3]
+    for day in WEEKDAYS + ["Sunday"]:
+        if day.lower().startswith(prefix) and len(prefix) == 3:
+            return day
+    return None
+
+def coerce_calendar_event(item: Any) -> Optional[Dict[str, Any]]:
+    """Best-effort CalendarEvent from an LLM item; None if it has no usable name or date"""
+    if not isinstance(item, dict):
+        return None
+    name = item.get('name') or item.get('title') or item.get('event')
+    date_value = coerce_date(item.get('date'))
+    if not name or date_value is None:
+        return None
+    event_type = str(item.get('type') or "other").strip().lower()
+    event = {
+        "name": str(name),
+        "date": date_value,
+        "time": str(item['time']) if item.get('time') else None,
+        "type": event_type if event_type in CALENDAR_EVENT_TYPES else "other",
+        "description": str(item['description']) if item.get('description') else None
+    }
+    try:
+        return CalendarEvent(**event).model_dump()
+    except ValidationError:
+        return None
+
+def coerce_timetable_event(item: Any) -> Optional[Dict[str, Any]]:
+    """Best-effort TimetableEvent from an LLM item; None without a subject, weekday and time"""
+    if not isinstance(item, dict):
+        return None
+    subject = item.get('subject') or item.get('course') or item.get('name')
+    day = coerce_weekday(item.get('day'))
+    time_value = item.get('time')
+    if not subject or day is None or not time_value:
+        return None
+    event = {"subject": str(subject), "day": day, "time": str(time_value)}
+    for field in ("duration", "room", "instructor"):
+        event[field] = str(item[field]) if item.get(field) not in (None, "") else None
+    try:
+        return TimetableEvent(**event).model_dump()
+    except ValidationError:
+        return None
+
+LLM_ITEM_COERCERS = {"calendar": coerce_calendar_event, "timetable": coerce_timetable_event}
+
+def validate_llm_analysis(
+    task: str,
+    analysis: Dict[str, Any],
+    extracted_text: str,
+    fallback: Callable[[str], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Coerce an LLM analysis onto the response schemas, filling only missing fields from the local parser"""
+    items_key, coerce = LLM_ITEMS_KEYS[task], LLM_ITEM_COERCERS[task]
+    required_fields = CALENDAR_REQUIRED_FIELDS if task == "calendar" else TIMETABLE_REQUIRED_FIELDS
+    result = dict(analysis)
+    raw_items = analysis.get(items_key) if isinstance(analysis.get(items_key), list) else []
+    items = []
+    for raw_item in raw_items:
+        item = coerce(raw_item)
+        if item is None:
+            llm_repair_stats.record("dropped_items")
+            continue
+        if any(raw_item.get(key) != value for key, value in item.items() if value is not None):
+            llm_repair_stats.record("coerced_items")
+        items.append(item)
+    result[items_key] = items
+    
+    total_working_days = coerce_int(analysis.get('total_working_days'))
+    result['total_working_days'] = max(total_working_days, 0) if total_working_days is not None else None
+    try:
+        result['confidence_score'] = min(max(float(analysis.get('confidence_score')), 0.0), 1.0)
+    except (TypeError, ValueError):
+        result['confidence_score'] = None
+    if task == "calendar":
+        result['semester_start'] = coerce_date(analysis.get('semester_start'))
+        result['semester_end'] = coerce_date(analysis.get('semester_end'))
+    else:
+        # Rebuilt from the validated classes so the two views cannot disagree
+        weekly_schedule = {day: [] for day in WEEKDAYS}
+        for item in items:
+            weekly_schedule.setdefault(item['day'], []).append(item)
+        result['weekly_schedule'] = weekly_schedule
+    
+    missing = [field for field in required_fields + ('confidence_score',) if result.get(field) in (None, [], "")]
+    if missing:
+        local_result = fallback(extracted_text)
+        for field in missing:
+            if local_result.get(field) not in (None, [], ""):
+                result[field] = local_result[field]
+                llm_repair_stats.record("fallback_fields")
+        if task == "timetable" and "timetable_events" in missing and result['timetable_events']:
+            result['weekly_schedule'] = local_result.get('weekly_schedule', result['weekly_schedule'])
+    if result.get('total_working_days') is None:
+        result['total_working_days'] = 0
+    if result.get('confidence_score') is None:
+        result['confidence_score'] = 0.0
+    return result
+
+async def run_llm_analysis(
+    task: str,
+    prompt_version: str,
+    prompt: str,
+    extracted_text: str,
+    fallback: Callable[[str], Dict[str, Any]],
+    sources: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Answer from the LLM result cache, else ask the LLM; falls back to local parsing on failure
+
+    Appends to `sources` where the answer came from: "cache", "llm" or "fallback"
+    (the local parser standing in for the LLM).
+    """
+    def record_source(source: str):
+        if sources is not None:
+            sources.append(source)
+    
+    if llm_client is None:
+        logger.warning("No OpenAI or Gemini API key available, using fallback method")
+        record_source("fallback")
+        return fallback(extracted_text)
+    cache_key = LLMResultCache.key(task, extracted_text, prompt_version, llm_client.provider.name, llm_client.provider.model)
+    cached = llm_result_cache.get(cache_key)
+    if cached is not None:
+        record_source("cache")
+        return cached
+    try:
+        start = time.perf_counter()
+        result = await llm_client.complete(prompt)
+        parsed_result, repair_path = parse_llm_json(result, (LLM_ITEMS_KEYS[task],))
+        llm_repair_stats.record(repair_path)
+        if parsed_result is None:
+            logger.error(f"Failed to parse {llm_client.provider.name} response as JSON")
+            llm_repair_stats.record("full_fallbacks")
+            record_source("fallback")
+            return fallback(extracted_text)
+        parsed_result = validate_llm_analysis(task, parsed_result, extracted_text, fallback)
+        # Only genuine LLM answers are cached; fallbacks are cheap and should be retried
+        llm_result_cache.set(cache_key, parsed_result, time.perf_counter() - start)
+        record_source("llm")
+        return parsed_result
+    except Exception as e:
+        logger.error(f"AI analysis failed: {e}")
+        record_source("fallback")
+        return fallback(extracted_text)
+
+class IncrementalJSONArrayParser:
+    """Parses the items of one top-level array (e.g. "events") out of a streamed JSON object
+
+    Items are returned as soon as their closing brace arrives, so they can be forwarded
+    before the response is complete and survive a truncated or malformed tail.
+    """
+
+    SCALAR_FIELD_PATTERN = re.compile(r'"(semester_start|semester_end|total_working_days|confidence_score)"\s*:\s*("[^"]*"|-?\d+(?:\.\d+)?|null)')
+
+    def __init__(self, key: str):
+        self.key = key
+        self.buffer = ""
+        self.items: List[Dict[str, Any]] = []
+        self.malformed_items = 0
+        self._position = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._array_depth: Optional[int] = None
+        self._array_closed = False
+        self._item_start: Optional[int] = None
+        self._key_pattern = re.compile(rf'"{re.escape(key)}"\s*:\s*$')
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume more response text and return the items it completed"""
+        self.buffer += text
+        completed = []
+        for index in range(self._position, len(self.buffer)):
+            char = self.buffer[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if (
+                    char == "[" and self._array_depth is None and self._stack == ["{"]
+                    and self._key_pattern.search(self.buffer[max(0, index - len(self.key) - 32):index])
+                ):
+                    self._array_depth = 2
+                if char == "{" and self._array_depth is not None and not self._array_closed and len(self._stack) == self._array_depth:
+                    self._item_start = index
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._array_depth is None or self._array_closed:
+                    continue
+                if char == "}" and self._item_start is not None and len(self._stack) == self._array_depth:
+                    try:
+                        item = json.loads(self.buffer[self._item_start:index + 1])
+                        self.items.append(item)
+                        completed.append(item)
+                    except json.JSONDecodeError:
+                        self.malformed_items += 1
+                    self._item_start = None
+                elif char == "]" and len(self._stack) == self._array_depth - 1:
+                    self._array_closed = True
+        self._position = len(self.buffer)
+        return completed
+
+    def result(self) -> tuple:
+        """Return (analysis, complete); an unparseable response keeps the items parsed so far"""
+        parsed, repair_path = parse_llm_json(self.buffer, (self.key,))
+        llm_repair_stats.record(repair_path)
+        if parsed is not None:
+            return parsed, True
+        salvaged: Dict[str, Any] = {self.key: list(self.items)}
+        for field, value in self.SCALAR_FIELD_PATTERN.findall(self.buffer):
+            salvaged.setdefault(field, json.loads(value))
+        return salvaged, False
+
+async def stream_llm_analysis(
+    task: str,
+    prompt_version: str,
+    prompt: str,
+    extracted_text: str,
+    fallback: Callable[[str], Dict[str, Any]],
+    items_key: str
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream one LLM analysis: yields {"item": ...} per completed array item, then {"analysis": ..., "source": ...}"""
+    cache_key = LLMResultCache.key(task, extracted_text, prompt_version, llm_client.provider.name, llm_client.provider.model)
+    cached = llm_result_cache.get(cache_key)
+    if cached is not None:
+        for item in cached.get(items_key, []):
+            yield {"item": item}
+        yield {"analysis": cached, "source": "cache"}
+        return
+    
+    parser = IncrementalJSONArrayParser(items_key)
+    coerce = LLM_ITEM_COERCERS[task]
+    start = time.perf_counter()
+    try:
+        async for piece in llm_client.stream(prompt):
+            for raw_item in parser.feed(piece):
+                # Same coercion validate_llm_analysis applies, so streamed items match the final analysis
+                item = coerce(raw_item)
+                if item is not None:
+                    yield {"item": item}
+    except Exception as e:
+        logger.error(f"AI analysis stream failed after {len(parser.items)} items: {e}")
+    
+    analysis, complete = parser.result()
+    if complete:
+        analysis = validate_llm_analysis(task, analysis, extracted_text, fallback)
+        llm_result_cache.set(cache_key, analysis, time.perf_counter() - start)
+        yield {"analysis": analysis, "source": "llm"}
+    elif parser.items:
+        logger.warning(f"Kept {len(parser.items)} {items_key} from an incomplete {llm_client.provider.name} response")
+        llm_repair_stats.record("partial_streams")
+        yield {"analysis": validate_llm_analysis(task, analysis, extracted_text, fallback), "source": "partial"}
+    else:
+        llm_repair_stats.record("full_fallbacks")
+        analysis = fallback(extracted_text)
+        for item in analysis.get(items_key, []):
+            yield {"item": item}
+        yield {"analysis": analysis, "source": "fallback"}
+
+async def stream_tiered_analysis(
+    task: str,
+    extracted_text: str,
+    local_parser: Callable[[str], Dict[str, Any]],
+    required_fields: tuple,
+    prompt_version: str,
+    build_prompt: Callable[[str], str],
+    items_key: str,
+    merge: Callable[[List[Dict[str, Any]], Optional[List[int]]], Dict[str, Any]],
+    relevance_filter: "RelevanceFilter"
+) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming counterpart of run_tiered_analysis: items are yielded as soon as any chunk produces them"""
+    start = time.perf_counter()
+    local_result = local_parser(extracted_text)
+    confidence = float(local_result.get('confidence_score') or 0.0)
+    missing = [field for field in required_fields if not local_result.get(field)]
+    confident = confidence >= ANALYSIS_CONFIDENCE_THRESHOLD and not missing
+    if confident or llm_client is None:
+        # Same labels as run_tiered_analysis: "local_only" only when escalation was wanted but impossible
+        analysis_tier_stats.record(task, "local" if confident else "local_only", time.perf_counter() - start)
+        for item in local_result.get(items_key, []):
+            yield {"item": item}
+        yield {"analysis": local_result, "source": "local"}
+        return
+    
+    prompt_text = relevance_filter.apply(extracted_text)
+    chunks = split_text_into_chunks(prompt_text, LLM_CHUNK_CHARS) or [prompt_text]
+    messages: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
+    
+    async def run_chunk(index: int, chunk: str):
+        try:
+            async with semaphore:
+                async for message in stream_llm_analysis(task, prompt_version, build_prompt(chunk), chunk, local_parser, items_key):
+                    await messages.put((index, message))
+        finally:
+            await messages.put((index, None))
+    
+    tasks = [asyncio.create_task(run_chunk(index, chunk)) for index, chunk in enumerate(chunks)]
+    analyses: List[Dict[str, Any]] = [{} for _ in chunks]
+    sources = set()
+    seen_items = set()
+    finished = 0
+    try:
+        while finished < len(tasks):
+            index, message = await messages.get()
+            if message is None:
+                finished += 1
+            elif "item" in message:
+                # Overlapping chunks can repeat an item; forward each one once
+                item_key = json.dumps(message["item"], sort_keys=True)
+                if item_key not in seen_items:
+                    seen_items.add(item_key)
+                    yield message
+            else:
+                analyses[index] = message["analysis"]
+                sources.add(message["source"])
+    finally:
+        for task_ in tasks:
+            task_.cancel()
+    
+    analysis_tier_stats.record(task, "llm", time.perf_counter() - start)
+    # Merging also rebuilds derived fields (e.g. weekly_schedule) missing from a partial response
+    if len(chunks) == 1 and "partial" not in sources:
+        analysis = analyses[0]
+    else:
+        analysis = merge(analyses, [len(chunk) for chunk in chunks])
+    yield {"analysis": analysis, "source": "+".join(sorted(sources))}
+
+def calendar_prompt(text: str) -> str:
+    """Prompt asking for the academic events in (a chunk of) calendar text"""
+    return f"""
+    Analyze the following academic calendar text and extract all academic events, classes, and important dates.\n\nText from PDF:\n{text}\n\nPlease provide a JSON response with the following structure:\n{{\n    \"events\": [\n        {{\n            \"name\": \"Event name\",\n            \"date\": \"YYYY-MM-DD\",\n            \"time\": \"HH:MM\" (optional),\n            \"type\": \"lecture|tutorial|lab|exam|holiday|other\",\n            \"description\": \"Brief description\"\n        }}\n    ],\n    \"semester_start\": \"YYYY-MM-DD\",\n    \"semester_end\": \"YYYY-MM-DD\",\n    \"total_working_days\": number,\n    \"confidence_score\": 0.0-1.0\n}}\n\nRules:\n1. Only include actual academic events (classes, exams, etc.)\n2. Exclude weekends unless explicitly mentioned as class days\n3. Convert all dates to YYYY-MM-DD format\n4. If time is mentioned, include it in HH:MM format\n5. Categorize events appropriately\n6. Calculate total working days from semester_start to semester_end (Monday to Saturday, excluding holidays), for the whole semester even if this text is only part of the calendar\n7. Provide confidence score based on text clarity\n"""
+
+def timetable_prompt(text: str) -> str:
+    """Prompt asking for the weekly class schedule in (a chunk of) timetable text"""
+    return f"""
+    Analyze the following timetable text and extract all class schedules, subjects, and weekly patterns.\n\nText from PDF:\n{text}\n\nPlease provide a JSON response with the following structure:\n{{\n    \"timetable_events\": [\n        {{\n            \"subject\": \"Subject name\",\n            \"day\": \"Monday|Tuesday|Wednesday|Thursday|Friday|Saturday\",\n            \"time\": \"HH:MM-HH:MM\",\n            \"duration\": \"X hours\" (optional),\n            \"room\": \"Room number\" (optional),\n            \"instructor\": \"Instructor name\" (optional)\n        }}\n    ],\n    \"weekly_schedule\": {{\n        \"Monday\": [list of events],\n        \"Tuesday\": [list of events],\n        \"Wednesday\": [list of events],\n        \"Thursday\": [list of events],\n        \"Friday\": [list of events],\n        \"Saturday\": [list of events]\n    }},\n    \"total_working_days\": number,\n    \"confidence_score\": 0.0-1.0\n}}\n\nCRITICAL RULES FOR SUBJECT vs INSTRUCTOR IDENTIFICATION:\n1. SUBJECT should be the academic course name (e.g., \"Mathematics\", \"Physics\", \"Computer Science\", \"English Literature\")\n2. INSTRUCTOR should be the professor/teacher name (e.g., \"Dr. Smith\", \"Prof. Johnson\", \"Mr. Brown\")\n3. If you see a person's name, it's likely an INSTRUCTOR, not a subject\n4. Common subjects include: Mathematics, Physics, Chemistry, Biology, Computer Science, English, History, Geography, Economics, etc.\n5. If unsure, prioritize academic subject names over person names for the subject field\n6. Look for patterns like \"Prof.\", \"Dr.\", \"Mr.\", \"Ms.\" to identify instructors\n7. Extract all class subjects and their schedules\n8. Identify which days have classes (working days)\n9. Include time slots in HH:MM-HH:MM format\n10. Extract room numbers and instructor names if available\n11. Calculate total working days based on days with classes\n12. Exclude Sundays and holidays\n13. Provide confidence score based on text clarity\n"""
+
+async def run_chunked_llm_analysis(
+    task: str,
+    prompt_version: str,
+    build_prompt: Callable[[str], str],
+    extracted_text: str,
+    fallback: Callable[[str], Dict[str, Any]],
+    merge: Callable[[List[Dict[str, Any]], Optional[List[int]]], Dict[str, Any]],
+    relevance_filter: Optional["RelevanceFilter"] = None,
+    sources: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Analyze text that may exceed one prompt by mapping over chunks concurrently and merging the results"""
+    if llm_client is None:
+        logger.warning("No OpenAI or Gemini API key available, using fallback method")
+        if sources is not None:
+            sources.append("fallback")
+        return fallback(extracted_text)
+    if relevance_filter is not None:
+        extracted_text = relevance_filter.apply(extracted_text)
+    chunks = split_text_into_chunks(extracted_text, LLM_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        return await run_llm_analysis(task, prompt_version, build_prompt(extracted_text), extracted_text, fallback, sources)
     
-    try:
-        # Method 1: PyPDF2
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        
-        # If PyPDF2 didn't extract much text, try pdfplumber
-        if len(text.strip()) < 100:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-        
-        # If still no text, try OCR
-        if len(text.strip()) < 50:
-            text = extract_text_with_ocr(pdf_path)
-            
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF: {e}")
-        text = extract_text_with_ocr(pdf_path)
+    semaphore = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
     
-    return text
+    async def analyze_chunk(chunk: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_llm_analysis(task, prompt_version, build_prompt(chunk), chunk, fallback, sources)
+    
+    start = time.perf_counter()
+    analyses = await asyncio.gather(*[analyze_chunk(chunk) for chunk in chunks])
+    logger.info(f"Analyzed {task} text in {len(chunks)} chunks ({len(extracted_text)} chars) in {time.perf_counter() - start:.2f}s")
+    return merge(analyses, [len(chunk) for chunk in chunks])
 
-def extract_text_with_ocr(pdf_path: str) -> str:
-    """Extract text using OCR for image-based PDFs"""
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                # Convert page to image
-                img = page.to_image()
-                if img:
-                    # Convert to PIL Image
-                    pil_img = img.original
-                    
-                    # Preprocess image for better OCR
-                    img_array = np.array(pil_img)
-                    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-                    
-                    # Apply thresholding
-                    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                    
-                    # Convert back to PIL
-                    pil_thresh = Image.fromarray(thresh)
-                    
-                    # Extract text using OCR
-                    page_text = pytesseract.image_to_string(pil_thresh)
-                    text += page_text + "\n"
-            
+async def analyze_calendar_with_ai(extracted_text: str, sources: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Use the LLM to identify academic events, chunking long calendars"""
+    return await run_chunked_llm_analysis(
+        "calendar", CALENDAR_PROMPT_VERSION, calendar_prompt, extracted_text, extract_basic_dates, merge_calendar_analyses,
+        calendar_relevance_filter, sources
+    )
+
+async def analyze_timetable_with_ai(extracted_text: str, sources: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Use the LLM to identify timetable events, chunking long timetables"""
+    return await run_chunked_llm_analysis(
+        "timetable", TIMETABLE_PROMPT_VERSION, timetable_prompt, extracted_text, extract_basic_timetable, merge_timetable_analyses,
+        timetable_relevance_filter, sources
+    )
+
+def split_text_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars, preferring paragraph, then line boundaries"""
+    if len(text) <= max_chars:
+        return [text] if text.strip() else []
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        for line in paragraph.split("\n"):
+            # Only a single over-long line is ever cut mid-line
+            while len(line) > max_chars:
+                pieces.append(line[:max_chars])
+                line = line[max_chars:]
+            pieces.append(line)
+        pieces.append("")
+    chunks = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current}\n{piece}" if current else piece
+        if len(candidate) > max_chars:
+            chunks.append(current)
+            candidate = piece
+        current = candidate
+    chunks.append(current)
+    return [chunk.strip("\n") for chunk in chunks if chunk.strip()]
+
+MONTH_PATTERN = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+RELEVANCE_PATTERNS = [
+    # Dates: "2 June 2025", "June 2", "02/06/2025", "2025-06-02"
+    rf"\b\d{{1,2}}(?:st|nd|rd|th)?\s+{MONTH_PATTERN}",
+    rf"\b{MONTH_PATTERN}\s+\d{{1,2}}\b",
+    r"\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b",
+    r"\b\d{4}-\d{2}-\d{2}\b",
+    # Weekdays, times and time ranges, day counts
+    r"\b(?:mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(?:day|sday|nesday|rsday|urday)?\b",
+    r"\b\d{1,2}[:.]\d{2}\s*(?:am|pm)?\b",
+    r"\b\d+\s+days?\b",
+]
+CALENDAR_KEYWORDS = [
+    "exam", "examination", "test", "assessment", "holiday", "vacation", "break", "semester", "term",
+    "trimester", "instruction", "class", "lecture", "commencement", "orientation", "registration",
+    "convocation", "event", "week", "festival"
+]
+TIMETABLE_KEYWORDS = [
+    "lecture", "tutorial", "lab", "practical", "room", "prof", "professor", "dr.", "period", "slot",
+    "session", "class", "break", "lunch", "elective", "section"
+]
+
+def keyword_pattern(keyword: str) -> str:
+    """Whole-word pattern for a keyword, allowing a plural ending ("exams", "classes")"""
+    pattern = rf"\b{re.escape(keyword)}"
+    if keyword[-1].isalnum():
+        pattern += r"(?:s|es)?\b"
+    return pattern
+
+class RelevanceFilter:
+    """Keeps only text segments that look like schedule content, plus a little surrounding context
+
+    PDF text layers often put a whole table on one line, so text is split on line breaks,
+    runs of spaces (table column gaps) and bullet glyphs rather than on lines alone.
+    """
+
+    def __init__(self, keywords: List[str], context: int, enabled: bool = True):
+        self.context = context
+        self.enabled = enabled
+        self.pattern = re.compile(
+            "|".join(RELEVANCE_PATTERNS + [keyword_pattern(keyword) for keyword in keywords]),
+            re.IGNORECASE
+        )
+        self.calls = 0
+        self.chars_in = 0
+        self.chars_out = 0
+        self._lock = threading.Lock()
+
+    def apply(self, text: str) -> str:
+        if not self.enabled:
             return text
-    except Exception as e:
-        logger.error(f"Error in OCR extraction: {e}")
-        return ""
+        segments = [segment.strip() for segment in re.split(r"\n|\s{2,}|\s*[\u2022\u25aa\u25cf\uf0a7\uf0b7]\s*", text)]
+        segments = [segment for segment in segments if segment]
+        keep = set()
+        for index, segment in enumerate(segments):
+            if self.pattern.search(segment):
+                keep.update(range(max(0, index - self.context), min(len(segments), index + self.context + 1)))
+        # Nothing recognisable: send the text unchanged rather than an empty prompt
+        filtered = "\n".join(segments[index] for index in sorted(keep)) if keep else text
+        with self._lock:
+            self.calls += 1
+            self.chars_in += len(text)
+            self.chars_out += len(filtered)
+        return filtered
 
-def analyze_calendar_with_ai(extracted_text: str) -> Dict[str, Any]:
-    """Use OpenAI to analyze the extracted text and identify academic events"""
-    prompt = f"""
-    Analyze the following academic calendar text and extract all academic events, classes, and important dates.\n\nText from PDF:\n{extracted_text[:4000]}  # Limit text length for API\n\nPlease provide a JSON response with the following structure:\n{{\n    \"events\": [\n        {{\n            \"name\": \"Event name\",\n            \"date\": \"YYYY-MM-DD\",\n            \"time\": \"HH:MM\" (optional),\n            \"type\": \"lecture|tutorial|lab|exam|holiday|other\",\n            \"description\": \"Brief description\"\n        }}\n    ],\n    \"semester_start\": \"YYYY-MM-DD\",\n    \"semester_end\": \"YYYY-MM-DD\",\n    \"total_working_days\": number,\n    \"confidence_score\": 0.0-1.0\n}}\n\nRules:\n1. Only include actual academic events (classes, exams, etc.)\n2. Exclude weekends unless explicitly mentioned as class days\n3. Convert all dates to YYYY-MM-DD format\n4. If time is mentioned, include it in HH:MM format\n5. Categorize events appropriately\n6. Calculate total working days (excluding weekends and holidays)\n7. Provide confidence score based on text clarity\n"""
-    try:
-        if OPENAI_API_KEY:
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            result = response.choices[0].message.content
-            try:
-                parsed_result = json.loads(result)
-                return parsed_result
-            except json.JSONDecodeError:
-                logger.error("Failed to parse OpenAI response as JSON")
-                return extract_basic_dates(extracted_text)
-        elif GEMINI_API_KEY:
-            model = genai.GenerativeModel("gemini-1.5-pro")
-            response = model.generate_content(prompt)
-            result = response.text
-            try:
-                parsed_result = json.loads(result)
-                return parsed_result
-            except json.JSONDecodeError:
-                logger.error("Failed to parse Gemini response as JSON")
-                return extract_basic_dates(extracted_text)
-        else:
-            logger.warning("No OpenAI or Gemini API key available, using fallback method")
-            return extract_basic_dates(extracted_text)
-    except Exception as e:
-        logger.error(f"AI analysis failed: {e}")
-        return extract_basic_dates(extracted_text)
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "chars_in": self.chars_in,
+            "chars_out": self.chars_out,
+            "reduction": round(1 - self.chars_out / self.chars_in, 4) if self.chars_in else 0.0
+        }
 
-def analyze_timetable_with_ai(extracted_text: str) -> Dict[str, Any]:
-    """Use OpenAI to analyze the extracted text and identify timetable events"""
-    prompt = f"""
-    Analyze the following timetable text and extract all class schedules, subjects, and weekly patterns.\n\nText from PDF:\n{extracted_text[:4000]}  # Limit text length for API\n\nPlease provide a JSON response with the following structure:\n{{\n    \"timetable_events\": [\n        {{\n            \"subject\": \"Subject name\",\n            \"day\": \"Monday|Tuesday|Wednesday|Thursday|Friday|Saturday\",\n            \"time\": \"HH:MM-HH:MM\",\n            \"duration\": \"X hours\" (optional),\n            \"room\": \"Room number\" (optional),\n            \"instructor\": \"Instructor name\" (optional)\n        }}\n    ],\n    \"weekly_schedule\": {{\n        \"Monday\": [list of events],\n        \"Tuesday\": [list of events],\n        \"Wednesday\": [list of events],\n        \"Thursday\": [list of events],\n        \"Friday\": [list of events],\n        \"Saturday\": [list of events]\n    }},\n    \"total_working_days\": number,\n    \"confidence_score\": 0.0-1.0\n}}\n\nCRITICAL RULES FOR SUBJECT vs INSTRUCTOR IDENTIFICATION:\n1. SUBJECT should be the academic course name (e.g., \"Mathematics\", \"Physics\", \"Computer Science\", \"English Literature\")\n2. INSTRUCTOR should be the professor/teacher name (e.g., \"Dr. Smith\", \"Prof. Johnson\", \"Mr. Brown\")\n3. If you see a person's name, it's likely an INSTRUCTOR, not a subject\n4. Common subjects include: Mathematics, Physics, Chemistry, Biology, Computer Science, English, History, Geography, Economics, etc.\n5. If unsure, prioritize academic subject names over person names for the subject field\n6. Look for patterns like \"Prof.\", \"Dr.\", \"Mr.\", \"Ms.\" to identify instructors\n7. Extract all class subjects and their schedules\n8. Identify which days have classes (working days)\n9. Include time slots in HH:MM-HH:MM format\n10. Extract room numbers and instructor names if available\n11. Calculate total working days based on days with classes\n12. Exclude Sundays and holidays\n13. Provide confidence score based on text clarity\n"""
-    try:
-        if OPENAI_API_KEY:
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            result = response.choices[0].message.content
-            try:
-                parsed_result = json.loads(result)
-                return parsed_result
-            except json.JSONDecodeError:
-                logger.error("Failed to parse OpenAI response as JSON")
-                return extract_basic_timetable(extracted_text)
-        elif GEMINI_API_KEY:
-            model = genai.GenerativeModel("gemini-1.5-pro")
-            response = model.generate_content(prompt)
-            result = response.text
-            try:
-                parsed_result = json.loads(result)
-                return parsed_result
-            except json.JSONDecodeError:
-                logger.error("Failed to parse Gemini response as JSON")
-                return extract_basic_timetable(extracted_text)
-        else:
-            logger.warning("No OpenAI or Gemini API key available, using fallback method")
-            return extract_basic_timetable(extracted_text)
-    except Exception as e:
-        logger.error(f"AI analysis failed: {e}")
-        return extract_basic_timetable(extracted_text)
+calendar_relevance_filter = RelevanceFilter(CALENDAR_KEYWORDS, PROMPT_FILTER_CONTEXT, PROMPT_FILTER_ENABLED)
+timetable_relevance_filter = RelevanceFilter(TIMETABLE_KEYWORDS, PROMPT_FILTER_CONTEXT, PROMPT_FILTER_ENABLED)
+
+def calendar_event_key(event: Dict[str, Any]) -> tuple:
+    """Identity of a calendar event for de-duplication and diffs"""
+    return (str(event.get('name') or '').strip().lower(), event.get('date'), event.get('time'))
+
+def merge_calendar_analyses(analyses: List[Dict[str, Any]], weights: Optional[List[int]] = None) -> Dict[str, Any]:
+    """Deterministically merge analyses of disjoint parts (pages, chunks) of one calendar
+
+    Events are de-duplicated and sorted by date, the semester spans the earliest start
+    to the latest end and confidence is a weighted mean. Working days are recounted from
+    the parts' semester spans and holidays, since every part may report the whole
+    semester's total (summing would count it once per part).
+    """
+    weights = weights or [1] * len(analyses)
+    events = {}
+    for analysis in analyses:
+        for event in analysis.get('events', []):
+            events.setdefault(calendar_event_key(event), event)
+    ordered_events = sorted(
+        events.values(),
+        key=lambda event: (str(event.get('date') or ''), str(event.get('time') or ''), str(event.get('name') or ''))
+    )
+    starts = [analysis['semester_start'] for analysis in analyses if analysis.get('semester_start')]
+    ends = [analysis['semester_end'] for analysis in analyses if analysis.get('semester_end')]
+    scored = [(weight, analysis) for weight, analysis in zip(weights, analyses) if analysis]
+    total_weight = sum(weight for weight, _ in scored)
+    confidence = (
+        sum(weight * float(analysis.get('confidence_score') or 0.0) for weight, analysis in scored) / total_weight
+        if total_weight else 0.0
+    )
+    reported = [analysis for analysis in analyses if analysis]
+    if len(reported) == 1:
+        total_working_days = int(reported[0].get('total_working_days') or 0)
+    else:
+        total_working_days = count_working_days(
+            [(analysis.get('semester_start'), analysis.get('semester_end')) for analysis in analyses],
+            [event.get('date') for event in ordered_events if event.get('type') == "holiday"]
+        )
+        if total_working_days is None:
+            total_working_days = max((int(analysis.get('total_working_days') or 0) for analysis in analyses), default=0)
+    return {
+        "events": ordered_events,
+        "semester_start": min(starts) if starts else None,
+        "semester_end": max(ends) if ends else None,
+        "total_working_days": total_working_days,
+        "confidence_score": round(confidence, 4)
+    }
+
+def count_working_days(spans: List[tuple], holidays: List[Optional[str]]) -> Optional[int]:
+    """Days from Monday to Saturday covered by the union of (start, end) ISO date spans, minus holidays
+
+    Overlapping spans (e.g. chunks that each report the whole semester) count once, and
+    gaps between disjoint spans (e.g. terms on different pages) are not counted. Returns
+    None when no span has both dates.
+    """
+    ranges = []
+    for start, end in spans:
+        try:
+            ranges.append((date.fromisoformat(start), date.fromisoformat(end)))
+        except (TypeError, ValueError):
+            continue
+    if not ranges:
+        return None
+    holiday_dates = set()
+    for holiday in holidays:
+        try:
+            holiday_dates.add(date.fromisoformat(holiday))
+        except (TypeError, ValueError):
+            continue
+    days = set()
+    for start, end in ranges:
+        for offset in range((end - start).days + 1):
+            day = date.fromordinal(start.toordinal() + offset)
+            if day.weekday() != 6 and day not in holiday_dates:
+                days.add(day)
+    return len(days)
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+def merge_timetable_analyses(analyses: List[Dict[str, Any]], weights: Optional[List[int]] = None) -> Dict[str, Any]:
+    """Deterministically merge analyses of disjoint parts of one timetable
+
+    Classes are de-duplicated by subject, day and time and the weekly schedule is rebuilt
+    from them; working days are the distinct days that have classes.
+    """
+    weights = weights or [1] * len(analyses)
+    events = {}
+    for analysis in analyses:
+        for event in analysis.get('timetable_events', []):
+            key = (str(event.get('subject') or '').strip().lower(), event.get('day'), event.get('time'))
+            events.setdefault(key, event)
+    day_order = {day: index for index, day in enumerate(WEEKDAYS)}
+    ordered_events = sorted(
+        events.values(),
+        key=lambda event: (day_order.get(event.get('day'), len(WEEKDAYS)), str(event.get('time') or ''), str(event.get('subject') or ''))
+    )
+    weekly_schedule = {day: [] for day in WEEKDAYS}
+    for event in ordered_events:
+        if event.get('day') in weekly_schedule:
+            weekly_schedule[event['day']].append(event)
+    class_days = [day for day in WEEKDAYS if weekly_schedule[day]]
+    scored = [(weight, analysis) for weight, analysis in zip(weights, analyses) if analysis]
+    total_weight = sum(weight for weight, _ in scored)
+    confidence = (
+        sum(weight * float(analysis.get('confidence_score') or 0.0) for weight, analysis in scored) / total_weight
+        if total_weight else 0.0
+    )
+    return {
+        "timetable_events": ordered_events,
+        "weekly_schedule": weekly_schedule,
+        "total_working_days": len(class_days) or max((int(analysis.get('total_working_days') or 0) for analysis in analyses), default=0),
+        "confidence_score": round(confidence, 4)
+    }
+
+# Whole-word weekday names and abbreviations ("Mon", "Tues", "Thursday"); Sunday is never a class day
+WEEKDAY_WORD_PATTERN = re.compile(r"\b(mon|tue|tues|wed|thu|thur|thurs|fri|sat)(?:day|sday|nesday|rsday|urday)?\b")
 
 def extract_basic_timetable(text: str) -> Dict[str, Any]:
     """Fallback method to extract basic timetable information without AI"""
@@ -494,21 +3067,14 @@ def extract_basic_timetable(text: str) -> Dict[str, Any]:
         "Monday": [], "Tuesday": [], "Wednesday": [], 
         "Thursday": [], "Friday": [], "Saturday": []
     }
-    
-    # Simple pattern matching for days
-    day_patterns = {
-        "Monday": ["monday", "mon", "m"],
-        "Tuesday": ["tuesday", "tue", "t"],
-        "Wednesday": ["wednesday", "wed", "w"],
-        "Thursday": ["thursday", "thu", "th"],
-        "Friday": ["friday", "fri", "f"],
-        "Saturday": ["saturday", "sat", "s"]
-    }
+    reliable_events = 0
+    reliable_days = set()
     
     lines = text.lower().split('\n')
     for line in lines:
-        for day, patterns in day_patterns.items():
-            if any(pattern in line for pattern in patterns):
+        named_days = list(dict.fromkeys(coerce_weekday(match) for match in WEEKDAY_WORD_PATTERN.findall(line)))
+        for day in WEEKDAYS:
+            if day in named_days:
                 working_days.add(day)
                 # Try to extract subject and time
                 parts = line.split()
@@ -548,12 +3114,24 @@ def extract_basic_timetable(text: str) -> Dict[str, Any]:
                     }
                     timetable_events.append(event)
                     weekly_schedule[day].append(event)
+                    # A row is trustworthy when it names one weekday, an explicit time and a real subject
+                    if len(named_days) == 1 and time_match and subject != "Subject" and coerce_weekday(subject) is None:
+                        reliable_events += 1
+                        reliable_days.add(day)
+    
+    # Mostly trustworthy rows across several days can skip the LLM; anything else is only a hint
+    if reliable_events >= 3 and len(reliable_days) >= 2 and reliable_events >= 0.8 * len(timetable_events):
+        confidence_score = 0.8
+    elif reliable_events:
+        confidence_score = 0.5
+    else:
+        confidence_score = 0.2
     
     return {
         "timetable_events": timetable_events,
         "weekly_schedule": weekly_schedule,
         "total_working_days": len(working_days),
-        "confidence_score": 0.3
+        "confidence_score": confidence_score
     }
 
 def extract_basic_dates(text: str) -> Dict[str, Any]:
@@ -571,6 +3149,8 @@ def extract_basic_dates(text: str) -> Dict[str, Any]:
 
     events = []
     total_working_days = 0
+    semester_starts = []
+    semester_ends = []
     for i, (start_str, end_str, days_str) in enumerate(matches):
         try:
             start_date = datetime.strptime(start_str, '%d %B %Y')
@@ -593,6 +3173,8 @@ def extract_basic_dates(text: str) -> Dict[str, Any]:
                         "description": f"Regular class (auto-generated)"
                     })
                 total_working_days += len(class_days)
+                semester_starts.append(start_date.strftime('%Y-%m-%d'))
+                semester_ends.append(end_date.strftime('%Y-%m-%d'))
         except Exception as e:
             continue
 
@@ -611,106 +3193,344 @@ def extract_basic_dates(text: str) -> Dict[str, Any]:
                         "description": "Estimated from academic calendar"
                     })
 
+    # Validated instruction blocks are reliable; day counts alone are only an estimate
+    if semester_starts:
+        confidence_score = 0.9
+    elif total_working_days > 0:
+        confidence_score = 0.5
+    else:
+        confidence_score = 0.2
+    
     return {
         "events": events,
+        "semester_start": min(semester_starts) if semester_starts else None,
+        "semester_end": max(semester_ends) if semester_ends else None,
         "total_working_days": total_working_days,
-        "confidence_score": 0.7 if total_working_days > 0 else 0.2,
+        "confidence_score": confidence_score,
         "extracted_text": text[:1000]
     }
 
+# Tiered analysis: deterministic parsers first, LLM only when needed
+CALENDAR_REQUIRED_FIELDS = ("events", "semester_start", "semester_end", "total_working_days")
+TIMETABLE_REQUIRED_FIELDS = ("timetable_events", "total_working_days")
+
+class AnalysisTierStats:
+    """Counts which tier resolved each analysis and the time each tier took"""
+
+    def __init__(self):
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, task: str, tier: str, seconds: float):
+        with self._lock:
+            counters = self.tasks.setdefault(task, {})
+            counters[tier] = counters.get(tier, 0) + 1
+            counters[f"{tier}_seconds"] = counters.get(f"{tier}_seconds", 0.0) + seconds
+
+    def stats(self) -> Dict[str, Any]:
+        report = {}
+        with self._lock:
+            for task, counters in self.tasks.items():
+                # local: confident local parse; llm: escalated; local_only: escalation wanted but no LLM configured
+                resolved = {tier: counters.get(tier, 0) for tier in ("local", "llm", "local_only")}
+                requests = sum(resolved.values())
+                average_llm_seconds = counters.get("llm_seconds", 0.0) / resolved["llm"] if resolved["llm"] else None
+                if average_llm_seconds is None and llm_client is not None and llm_client.calls:
+                    average_llm_seconds = llm_client.total_seconds / llm_client.calls
+                report[task] = {
+                    "requests": requests,
+                    "resolved": resolved,
+                    "local_fraction": round((resolved["local"] + resolved["local_only"]) / requests, 4) if requests else 0.0,
+                    "average_seconds": {
+                        tier: round(counters[f"{tier}_seconds"] / count, 4) for tier, count in resolved.items() if count
+                    },
+                    # Estimated from the average latency of escalated requests (or of all LLM calls)
+                    "estimated_saved_seconds": round(resolved["local"] * average_llm_seconds, 3) if average_llm_seconds is not None else None
+                }
+        return report
+
+analysis_tier_stats = AnalysisTierStats()
+
+async def run_tiered_analysis(
+    task: str,
+    extracted_text: str,
+    local_parser: Callable[[str], Dict[str, Any]],
+    required_fields: tuple,
+    analyze_with_ai: Callable[[str, Optional[List[str]]], Awaitable[Dict[str, Any]]],
+    sources: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Return the local parser's result when it is confident and complete, otherwise escalate to the LLM
+
+    Appends to `sources` how the result was produced: "local" (confident local parse),
+    "local_only" (no provider configured), or the LLM path's "cache"/"llm"/"fallback" per chunk.
+    """
+    start = time.perf_counter()
+    local_result = local_parser(extracted_text)
+    confidence = float(local_result.get('confidence_score') or 0.0)
+    missing = [field for field in required_fields if not local_result.get(field)]
+    if confidence >= ANALYSIS_CONFIDENCE_THRESHOLD and not missing:
+        analysis_tier_stats.record(task, "local", time.perf_counter() - start)
+        if sources is not None:
+            sources.append("local")
+        return local_result
+    if llm_client is None:
+        analysis_tier_stats.record(task, "local_only", time.perf_counter() - start)
+        if sources is not None:
+            sources.append("local_only")
+        return local_result
+    
+    logger.info(f"Escalating {task} analysis to LLM (local confidence {confidence:.2f}, missing {missing or 'nothing'})")
+    result = await analyze_with_ai(extracted_text, sources)
+    analysis_tier_stats.record(task, "llm", time.perf_counter() - start)
+    return result
+
+async def analyze_calendar(extracted_text: str, sources: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Analyze calendar text, trying the local parser before the LLM"""
+    return await run_tiered_analysis(
+        "calendar", extracted_text, extract_basic_dates, CALENDAR_REQUIRED_FIELDS, analyze_calendar_with_ai, sources
+    )
+
+async def analyze_timetable(extracted_text: str, sources: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Analyze timetable text, trying the local parser before the LLM"""
+    return await run_tiered_analysis(
+        "timetable", extracted_text, extract_basic_timetable, TIMETABLE_REQUIRED_FIELDS, analyze_timetable_with_ai, sources
+    )
+
+def stream_calendar_analysis(extracted_text: str) -> AsyncIterator[Dict[str, Any]]:
+    return stream_tiered_analysis(
+        "calendar", extracted_text, extract_basic_dates, CALENDAR_REQUIRED_FIELDS, CALENDAR_PROMPT_VERSION,
+        calendar_prompt, "events", merge_calendar_analyses, calendar_relevance_filter
+    )
+
+def stream_timetable_analysis(extracted_text: str) -> AsyncIterator[Dict[str, Any]]:
+    return stream_tiered_analysis(
+        "timetable", extracted_text, extract_basic_timetable, TIMETABLE_REQUIRED_FIELDS, TIMETABLE_PROMPT_VERSION,
+        timetable_prompt, "timetable_events", merge_timetable_analyses, timetable_relevance_filter
+    )
+
+# Processing pipelines shared by the synchronous endpoints and the job API
+def calendar_result_from_analysis(analysis_result: Dict[str, Any], extracted_text: str) -> PDFProcessingResult:
+    """Convert a calendar analysis dict into the response model"""
+    events = []
+    for event_data in analysis_result.get('events', []):
+        events.append(CalendarEvent(**event_data))
+    
+    return PDFProcessingResult(
+        events=events,
+        total_working_days=analysis_result.get('total_working_days', 0),
+        semester_start=analysis_result.get('semester_start'),
+        semester_end=analysis_result.get('semester_end'),
+        confidence_score=analysis_result.get('confidence_score', 0.0),
+        extracted_text=extracted_text[:1000]  # Limit for response
+    )
+
+def report_progress(progress: Optional[Callable[[str], None]], stage: str):
+    """Notify a progress callback, if any, that a pipeline stage has started"""
+    if progress is not None:
+        progress(stage)
+
+def timetable_result_from_analysis(analysis_result: Dict[str, Any], extracted_text: str) -> TimetableProcessingResult:
+    """Convert a timetable analysis dict into the response model"""
+    timetable_events = []
+    for event_data in analysis_result.get('timetable_events', []):
+        timetable_events.append(TimetableEvent(**event_data))
+    
+    return TimetableProcessingResult(
+        timetable_events=timetable_events,
+        total_working_days=analysis_result.get('total_working_days', 0),
+        weekly_schedule=analysis_result.get('weekly_schedule', {}),
+        confidence_score=analysis_result.get('confidence_score', 0.0),
+        extracted_text=extracted_text[:1000]  # Limit for response
+    )
+
+async def process_calendar_upload(upload: IngestedUpload, progress: Optional[Callable[[str], None]] = None) -> PDFProcessingResult:
+    """Extract, analyze and assemble the result for an academic calendar PDF"""
+    # Extract text from PDF
+    report_progress(progress, "extract")
+    extracted_text = await extraction_executor.run(extract_upload_text, upload)
+    
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
+    
+    # Analyze with AI
+    report_progress(progress, "analyze")
+    analysis_result = await analyze_calendar(extracted_text)
+    
+    # Convert to response model
+    report_progress(progress, "assemble")
+    return calendar_result_from_analysis(analysis_result, extracted_text)
+
+async def process_timetable_upload(upload: IngestedUpload, progress: Optional[Callable[[str], None]] = None) -> TimetableProcessingResult:
+    """Extract, analyze and assemble the result for a timetable PDF or image"""
+    # Extract text from PDF or image
+    report_progress(progress, "extract")
+    extracted_text = await extraction_executor.run(extract_upload_text, upload)
+    
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="No text could be extracted from the file")
+    
+    # Analyze with AI
+    report_progress(progress, "analyze")
+    analysis_result = await analyze_timetable(extracted_text)
+    
+    # Convert to response model
+    report_progress(progress, "assemble")
+    return timetable_result_from_analysis(analysis_result, extracted_text)
+
+async def process_combined_uploads(
+    calendar_upload: IngestedUpload,
+    timetable_upload: IngestedUpload,
+    progress: Optional[Callable[[str], None]] = None
+) -> CombinedProcessingResult:
+    """Process a calendar and a timetable together into combined class counts
+
+    The two extract -> analyze pipelines are independent and run concurrently;
+    only the final assembly waits for both.
+    """
+    stage_timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    analyzing = False
+    
+    async def timed(stage: str, awaitable: Awaitable[Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            stage_timings[stage] = round(time.perf_counter() - start, 3)
+    
+    async def pipeline(name: str, upload: IngestedUpload, analyze: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        nonlocal analyzing
+        text = await timed(f"{name}_extract", extraction_executor.run(extract_upload_text, upload))
+        if not analyzing:
+            analyzing = True
+            report_progress(progress, "analyze")
+        return await timed(f"{name}_analyze", analyze(text))
+    
+    report_progress(progress, "extract")
+    calendar_analysis, timetable_analysis = await asyncio.gather(
+        pipeline("calendar", calendar_upload, analyze_calendar),
+        pipeline("timetable", timetable_upload, analyze_timetable)
+    )
+    
+    # Convert to response models
+    report_progress(progress, "assemble")
+    assemble_start = time.perf_counter()
+    calendar_events = []
+    for event_data in calendar_analysis.get('events', []):
+        calendar_events.append(CalendarEvent(**event_data))
+    
+    timetable_events = []
+    for event_data in timetable_analysis.get('timetable_events', []):
+        timetable_events.append(TimetableEvent(**event_data))
+    
+    # Calculate working days from calendar (when classes are held)
+    calendar_working_days = calendar_analysis.get('total_working_days', 0)
+    
+    # Calculate classes per working day from timetable
+    weekly_schedule = timetable_analysis.get('weekly_schedule', {})
+    working_days_with_classes = [day for day, classes in weekly_schedule.items() if classes]
+    total_classes_in_week = sum(len(classes) for classes in weekly_schedule.values())
+    
+    # Calculate average classes per working day
+    classes_per_working_day = total_classes_in_week // len(working_days_with_classes) if working_days_with_classes else 0
+    
+    # Calculate total classes: working days × classes per day
+    total_classes = calendar_working_days * classes_per_working_day if classes_per_working_day > 0 else calendar_working_days
+    
+    # Calculate combined confidence score
+    calendar_confidence = calendar_analysis.get('confidence_score', 0.0)
+    timetable_confidence = timetable_analysis.get('confidence_score', 0.0)
+    combined_confidence = (calendar_confidence + timetable_confidence) / 2
+    
+    stage_timings["assemble"] = round(time.perf_counter() - assemble_start, 3)
+    stage_timings["total"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Combined processing stage timings: {stage_timings}")
+    
+    return CombinedProcessingResult(
+        calendar_events=calendar_events,
+        timetable_events=timetable_events,
+        total_working_days=calendar_working_days,
+        calendar_working_days=calendar_working_days,
+        timetable_working_days=len(working_days_with_classes),
+        semester_start=calendar_analysis.get('semester_start'),
+        semester_end=calendar_analysis.get('semester_end'),
+        confidence_score=combined_confidence,
+        total_classes=total_classes,
+        classes_per_working_day=classes_per_working_day,
+        weekly_schedule=weekly_schedule,
+        stage_timings=stage_timings
+    )
+
 @app.post("/upload-calendar", response_model=PDFProcessingResult)
 async def upload_calendar(file: UploadFile = File(...)):
     """Upload and process academic calendar PDF"""
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-    
-    # Save uploaded file
-    file_path = os.path.join(UPLOAD_DIR, f"calendar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    upload = await ingest_upload(file, PDF_EXTENSIONS, "Only PDF files are allowed")
     
     try:
-        # Extract text from PDF
-        extracted_text = extract_text_from_pdf(file_path)
-        
-        if not extracted_text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
-        
-        # Analyze with AI
-        analysis_result = analyze_calendar_with_ai(extracted_text)
-        
-        # Convert to response model
-        events = []
-        for event_data in analysis_result.get('events', []):
-            events.append(CalendarEvent(**event_data))
-        
-        return PDFProcessingResult(
-            events=events,
-            total_working_days=analysis_result.get('total_working_days', 0),
-            semester_start=analysis_result.get('semester_start'),
-            semester_end=analysis_result.get('semester_end'),
-            confidence_score=analysis_result.get('confidence_score', 0.0),
-            extracted_text=extracted_text[:1000]  # Limit for response
-        )
-        
+        return await process_calendar_upload(upload)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing calendar PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
-    finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+
+def analysis_event_stream(
+    extracted_text: str,
+    analysis_stream: AsyncIterator[Dict[str, Any]],
+    item_model: type,
+    build_result: Callable[[Dict[str, Any], str], BaseModel]
+) -> StreamingResponse:
+    """NDJSON response: an "event" line per item as soon as it is parsed, then a "result" line"""
+    async def event_stream():
+        started = time.perf_counter()
+        try:
+            async for message in analysis_stream:
+                elapsed = round(time.perf_counter() - started, 3)
+                if "item" in message:
+                    try:
+                        event = item_model(**message["item"])
+                    except (ValidationError, TypeError):
+                        continue
+                    yield json.dumps({"type": "event", "event": event.model_dump(), "elapsed": elapsed}) + "\n"
+                else:
+                    result = build_result(message["analysis"], extracted_text)
+                    yield json.dumps({"type": "result", "source": message["source"], "result": result.model_dump(), "elapsed": elapsed}) + "\n"
+        except Exception as e:
+            logger.error(f"Streaming analysis failed: {e}")
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/upload-calendar/stream")
+async def upload_calendar_stream(file: UploadFile = File(...)):
+    """Upload a calendar PDF and stream its events as NDJSON while the analysis runs"""
+    upload = await ingest_upload(file, PDF_EXTENSIONS, "Only PDF files are allowed")
+    extracted_text = await extraction_executor.run(extract_upload_text, upload)
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
+    return analysis_event_stream(extracted_text, stream_calendar_analysis(extracted_text), CalendarEvent, calendar_result_from_analysis)
+
+@app.post("/upload-timetable/stream")
+async def upload_timetable_stream(file: UploadFile = File(...)):
+    """Upload a timetable PDF or image and stream its classes as NDJSON while the analysis runs"""
+    upload = await ingest_upload(file, TIMETABLE_EXTENSIONS, "Only PDF or image files (.pdf, .jpg, .jpeg, .png) are allowed")
+    extracted_text = await extraction_executor.run(extract_upload_text, upload)
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="No text could be extracted from the file")
+    return analysis_event_stream(extracted_text, stream_timetable_analysis(extracted_text), TimetableEvent, timetable_result_from_analysis)
 
 @app.post("/upload-timetable", response_model=TimetableProcessingResult)
 async def upload_timetable(file: UploadFile = File(...)):
     """Upload and process timetable PDF or image"""
-    allowed_exts = ['.pdf', '.jpg', '.jpeg', '.png']
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in allowed_exts:
-        raise HTTPException(status_code=400, detail="Only PDF or image files (.pdf, .jpg, .jpeg, .png) are allowed")
-    
-    # Save uploaded file
-    file_path = os.path.join(UPLOAD_DIR, f"timetable_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}")
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    upload = await ingest_upload(file, TIMETABLE_EXTENSIONS, "Only PDF or image files (.pdf, .jpg, .jpeg, .png) are allowed")
     
     try:
-        # Extract text from PDF or image
-        if ext == '.pdf':
-            extracted_text = extract_text_from_pdf(file_path)
-        else:
-            # For images, use OCR directly
-            img = Image.open(file_path)
-            extracted_text = pytesseract.image_to_string(img)
-        
-        if not extracted_text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from the file")
-        
-        # Analyze with AI
-        analysis_result = analyze_timetable_with_ai(extracted_text)
-        
-        # Convert to response model
-        timetable_events = []
-        for event_data in analysis_result.get('timetable_events', []):
-            timetable_events.append(TimetableEvent(**event_data))
-        
-        return TimetableProcessingResult(
-            timetable_events=timetable_events,
-            total_working_days=analysis_result.get('total_working_days', 0),
-            weekly_schedule=analysis_result.get('weekly_schedule', {}),
-            confidence_score=analysis_result.get('confidence_score', 0.0),
-            extracted_text=extracted_text[:1000]  # Limit for response
-        )
-        
+        return await process_timetable_upload(upload)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing timetable file: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
-    finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
 @app.post("/process-combined", response_model=CombinedProcessingResult)
 async def process_combined(
@@ -718,88 +3538,433 @@ async def process_combined(
     timetable_file: UploadFile = File(...)
 ):
     """Process both calendar and timetable files together (PDF or image for timetable)"""
-    cal_ext = os.path.splitext(calendar_file.filename)[1].lower()
-    tt_ext = os.path.splitext(timetable_file.filename)[1].lower()
-    if cal_ext != '.pdf' or tt_ext not in ['.pdf', '.jpg', '.jpeg', '.png']:
-        raise HTTPException(status_code=400, detail="Calendar must be PDF; Timetable must be PDF or image (.pdf, .jpg, .jpeg, .png)")
-    
-    # Save uploaded files
-    calendar_path = os.path.join(UPLOAD_DIR, f"calendar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
-    timetable_path = os.path.join(UPLOAD_DIR, f"timetable_{datetime.now().strftime('%Y%m%d_%H%M%S')}{tt_ext}")
+    calendar_upload = await ingest_upload(calendar_file, PDF_EXTENSIONS, COMBINED_UPLOAD_ERROR)
+    timetable_upload = await ingest_upload(timetable_file, TIMETABLE_EXTENSIONS, COMBINED_UPLOAD_ERROR)
     
     try:
-        # Save calendar file
-        async with aiofiles.open(calendar_path, 'wb') as f:
-            content = await calendar_file.read()
-            await f.write(content)
-        
-        # Save timetable file
-        async with aiofiles.open(timetable_path, 'wb') as f:
-            content = await timetable_file.read()
-            await f.write(content)
-        
-        # Process calendar
-        calendar_text = extract_text_from_pdf(calendar_path)
-        calendar_analysis = analyze_calendar_with_ai(calendar_text)
-        
-        # Process timetable
-        if tt_ext == '.pdf':
-            timetable_text = extract_text_from_pdf(timetable_path)
+        return await process_combined_uploads(calendar_upload, timetable_upload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing combined files: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
+
+# Incremental re-processing of revised calendars
+def calendar_manifest_key(sha256: str) -> str:
+    return f"manifest:{sha256}:{EXTRACTOR_VERSION}"
+
+def page_analysis_cache_keys(fingerprint: str) -> List[str]:
+    """Keys a page analysis may be cached under: a confident local parse, or the current LLM's answer"""
+    keys = [f"analysis:calendar:{fingerprint}:{EXTRACTOR_VERSION}:local"]
+    if llm_client is not None:
+        provider = llm_client.provider
+        keys.append(f"analysis:calendar:{fingerprint}:{EXTRACTOR_VERSION}:{CALENDAR_PROMPT_VERSION}:{provider.name}:{provider.model}")
+    return keys
+
+def get_cached_page_analysis(fingerprint: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not fingerprint:
+        return None
+    for key in page_analysis_cache_keys(fingerprint):
+        value = page_cache.get(key)
+        if value is None:
+            continue
+        entry = json.loads(value)
+        # LLM answers expire like the LLM result cache; confident local parses only change with EXTRACTOR_VERSION
+        if entry["source"] == "llm" and time.time() - entry["created_at"] > LLM_CACHE_TTL_SECONDS:
+            continue
+        return entry["analysis"]
+    return None
+
+def set_cached_page_analysis(fingerprint: str, analysis: Dict[str, Any], source: str):
+    key = page_analysis_cache_keys(fingerprint)[0 if source == "local" else 1]
+    page_cache.set(key, json.dumps({"source": source, "created_at": time.time(), "analysis": analysis}))
+
+async def process_calendar_revision(upload: IngestedUpload, previous_sha256: Optional[str] = None) -> CalendarRevisionResult:
+    """Process a calendar page by page, reusing cached extraction and analysis for unchanged pages"""
+    previous_manifest = None
+    if previous_sha256:
+        manifest = page_cache.get(calendar_manifest_key(previous_sha256))
+        previous_manifest = json.loads(manifest) if manifest is not None else None
+        # Manifests written before merged events were stored cannot be diffed against
+        if not isinstance(previous_manifest, dict):
+            raise HTTPException(status_code=404, detail="Previous calendar version not found; omit previous_sha256 to process from scratch")
+    previous_fingerprints = previous_manifest["fingerprints"] if previous_manifest is not None else None
+    
+    pages = await extraction_executor.run(extract_pdf_pages, upload.content)
+    extracted_text = "".join(page["text"] + "\n" for page in pages)
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
+    
+    async def analyze_page(page: Dict[str, Any]) -> tuple:
+        if not page["text"].strip():
+            return {}, "skipped"
+        fingerprint = page["fingerprint"]
+        cached = get_cached_page_analysis(fingerprint)
+        if cached is not None:
+            return cached, "cached"
+        sources: List[str] = []
+        analysis = await analyze_calendar(page["text"], sources)
+        # Fallback parses after an LLM failure (or without a provider) are not cached, so the
+        # page is analyzed properly once the LLM is back; a confident local parse is final
+        # Only these are merged: a fallback parse of a single page invents placeholder events
+        if sources == ["local"]:
+            if fingerprint:
+                set_cached_page_analysis(fingerprint, analysis, "local")
+        elif sources and not set(sources) & {"fallback", "local_only"}:
+            if fingerprint:
+                set_cached_page_analysis(fingerprint, analysis, "llm")
         else:
-            img = Image.open(timetable_path)
-            timetable_text = pytesseract.image_to_string(img)
-        timetable_analysis = analyze_timetable_with_ai(timetable_text)
-        
-        # Convert to response models
-        calendar_events = []
-        for event_data in calendar_analysis.get('events', []):
-            calendar_events.append(CalendarEvent(**event_data))
-        
-        timetable_events = []
-        for event_data in timetable_analysis.get('timetable_events', []):
-            timetable_events.append(TimetableEvent(**event_data))
-        
-        # Calculate working days from calendar (when classes are held)
-        calendar_working_days = calendar_analysis.get('total_working_days', 0)
-        
-        # Calculate classes per working day from timetable
-        weekly_schedule = timetable_analysis.get('weekly_schedule', {})
-        working_days_with_classes = [day for day, classes in weekly_schedule.items() if classes]
-        total_classes_in_week = sum(len(classes) for classes in weekly_schedule.values())
-        
-        # Calculate average classes per working day
-        classes_per_working_day = total_classes_in_week // len(working_days_with_classes) if working_days_with_classes else 0
+            return analysis, "unconfident"
+        return analysis, "analyzed"
+    
+    page_results = await asyncio.gather(*[analyze_page(page) for page in pages])
+    usable = [(analysis, page["chars"]) for page, (analysis, status) in zip(pages, page_results) if status in ("analyzed", "cached")]
+    if usable:
+        merged = merge_calendar_analyses([analysis for analysis, _ in usable], weights=[chars for _, chars in usable])
+    else:
+        # No page stands on its own; analyze the whole document as /upload-calendar does
+        merged = await analyze_calendar(extracted_text)
+    page_cache.set(calendar_manifest_key(upload.sha256), json.dumps({
+        "fingerprints": [page["fingerprint"] for page in pages],
+        "events": merged["events"]
+    }))
+    
+    # Diff against the merged events stored with the previous version
+    added_events: List[Dict[str, Any]] = []
+    removed_events: List[Dict[str, Any]] = []
+    if previous_manifest is not None:
+        previous_events = {calendar_event_key(event): event for event in previous_manifest["events"]}
+        current_events = {calendar_event_key(event): event for event in merged["events"]}
+        added_events = [event for key, event in current_events.items() if key not in previous_events]
+        removed_events = [event for key, event in previous_events.items() if key not in current_events]
+    
+    previous_set = set(previous_fingerprints or [])
+    reports = []
+    for page, (_, analysis_status) in zip(pages, page_results):
+        if previous_fingerprints is not None:
+            changed = page["fingerprint"] is None or page["fingerprint"] not in previous_set
+        else:
+            changed = analysis_status in ("analyzed", "unconfident")
+        reports.append(CalendarPageReport(
+            page=page["page"],
+            fingerprint=page["fingerprint"],
+            extraction=page["method"],
+            analysis=analysis_status,
+            changed=changed
+        ))
+    
+    return CalendarRevisionResult(
+        sha256=upload.sha256,
+        previous_sha256=previous_sha256,
+        result=calendar_result_from_analysis(merged, extracted_text),
+        pages=reports,
+        changed_pages=[report.page for report in reports if report.changed],
+        added_events=[CalendarEvent(**event) for event in added_events],
+        removed_events=[CalendarEvent(**event) for event in removed_events]
+    )
+
+@app.post("/upload-calendar-revision", response_model=CalendarRevisionResult)
+async def upload_calendar_revision(
+    file: UploadFile = File(...),
+    previous_sha256: Optional[str] = Form(None)
+):
+    """Process a (re-issued) calendar incrementally; pass the sha256 of the earlier version to get an event diff"""
+    upload = await ingest_upload(file, PDF_EXTENSIONS, "Only PDF files are allowed")
+    
+    try:
+        return await process_calendar_revision(upload, previous_sha256)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing calendar revision: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+
+# Background jobs
+class Job:
+    """A submitted processing job, its progress events and its eventual result"""
+
+    def __init__(self, kind: str):
+        self.job_id = secrets.token_urlsafe(12)
+        self.kind = kind
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[float] = None
+        self.events: List[JobEvent] = []
+        self.changed = asyncio.Event()
+        self._record()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def update(self, **fields):
+        """Apply a status/stage change and wake anyone streaming this job's events"""
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated_at = datetime.now().isoformat()
+        if self.finished:
+            self.finished_at = time.monotonic()
+        self._record()
+
+    def _record(self):
+        self.events.append(JobEvent(status=self.status, stage=self.stage, timestamp=self.updated_at))
+        # Waiters hold the old event, so setting it wakes them; new waiters get a fresh one
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def to_status(self) -> JobStatus:
+        return JobStatus(
+            job_id=self.job_id,
+            kind=self.kind,
+            status=self.status,
+            stage=self.stage,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            events=self.events,
+            result=self.result,
+            error=self.error
+        )
+
+class JobManager:
+    """Runs submitted jobs on the event loop with bounded concurrency and expires old results"""
+
+    def __init__(self, concurrency: int, max_pending: int, result_ttl_seconds: int):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.result_ttl_seconds = result_ttl_seconds
+        self.jobs: Dict[str, Job] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    def submit(self, kind: str, work: Callable[[Callable[[str], None]], Awaitable[BaseModel]]) -> Job:
+        """Queue work(progress) as a new job and return it immediately"""
+        self.purge_expired()
+        pending = sum(1 for job in self.jobs.values() if not job.finished)
+        if pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Too many jobs in progress, please retry shortly")
+        job = Job(kind)
+        self.jobs[job.job_id] = job
+        task = asyncio.create_task(self._run(job, work))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, work: Callable[[Callable[[str], None]], Awaitable[BaseModel]]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            job.update(status="running")
+            try:
+                result = await work(lambda stage: job.update(stage=stage))
+                job.update(status="completed", stage=None, result=result.model_dump())
+            except HTTPException as e:
+                job.update(status="failed", error=str(e.detail))
+            except Exception as e:
+                logger.error(f"Job {job.job_id} ({job.kind}) failed: {e}")
+                job.update(status="failed", error=str(e))
+
+    def get(self, job_id: str) -> Job:
+        self.purge_expired()
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found or expired")
+        return job
+
+    def purge_expired(self):
+        """Drop finished jobs whose results are older than the retention TTL"""
+        cutoff = time.monotonic() - self.result_ttl_seconds
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {"concurrency": self.concurrency, "max_pending": self.max_pending, **counts}
+
+job_manager = JobManager(JOB_CONCURRENCY, MAX_PENDING_JOBS, JOB_RESULT_TTL_SECONDS)
+
+@app.post("/jobs/calendar", response_model=JobStatus, status_code=202)
+async def submit_calendar_job(file: UploadFile = File(...)):
+    """Queue an academic calendar PDF for background processing"""
+    upload = await ingest_upload(file, PDF_EXTENSIONS, "Only PDF files are allowed")
+    job = job_manager.submit("calendar", lambda progress: process_calendar_upload(upload, progress))
+    return job.to_status()
+
+@app.post("/jobs/timetable", response_model=JobStatus, status_code=202)
+async def submit_timetable_job(file: UploadFile = File(...)):
+    """Queue a timetable PDF or image for background processing"""
+    upload = await ingest_upload(file, TIMETABLE_EXTENSIONS, "Only PDF or image files (.pdf, .jpg, .jpeg, .png) are allowed")
+    job = job_manager.submit("timetable", lambda progress: process_timetable_upload(upload, progress))
+    return job.to_status()
+
+@app.post("/jobs/combined", response_model=JobStatus, status_code=202)
+async def submit_combined_job(
+    calendar_file: UploadFile = File(...),
+    timetable_file: UploadFile = File(...)
+):
+    """Queue a calendar and timetable pair for background processing"""
+    calendar_upload = await ingest_upload(calendar_file, PDF_EXTENSIONS, COMBINED_UPLOAD_ERROR)
+    timetable_upload = await ingest_upload(timetable_file, TIMETABLE_EXTENSIONS, COMBINED_UPLOAD_ERROR)
+    job = job_manager.submit("combined", lambda progress: process_combined_uploads(calendar_upload, timetable_upload, progress))
+    return job.to_status()
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str):
+    """Poll a job's status, stage and (once completed) result"""
+    return job_manager.get(job_id).to_status()
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events stream of a job's progress, ending with its final status"""
+    job = job_manager.get(job_id)
+    
+    async def event_stream():
+        sent = 0
+        while True:
+            changed = job.changed
+            while sent < len(job.events):
+                yield f"event: progress\ndata: {job.events[sent].model_dump_json()}\n\n"
+                sent += 1
+            if job.finished:
+                yield f"event: {job.status}\ndata: {job.to_status().model_dump_json()}\n\n"
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=JOB_EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Batch processing
+@app.post("/batch-process")
+async def batch_process(
+    files: List[UploadFile] = File(...),
+    kind: str = Form("timetable"),
+    parallelism: Optional[int] = Form(None)
+):
+    """Process many calendars or timetables (files and/or .zip archives), streaming NDJSON results as each finishes"""
+    if kind == "calendar":
+        allowed_exts, error_detail, process = PDF_EXTENSIONS, "Only PDF files are allowed", process_calendar_upload
+    elif kind == "timetable":
+        allowed_exts, error_detail, process = TIMETABLE_EXTENSIONS, "Only PDF or image files (.pdf, .jpg, .jpeg, .png) are allowed", process_timetable_upload
+    else:
+        raise HTTPException(status_code=400, detail="kind must be 'calendar' or 'timetable'")
+    parallelism = BATCH_PARALLELISM if parallelism is None else parallelism
+    if parallelism < 1 or parallelism > BATCH_MAX_PARALLELISM:
+        raise HTTPException(status_code=400, detail=f"parallelism must be between 1 and {BATCH_MAX_PARALLELISM}")
+    
+    # Ingest everything up front: upload files are closed once the response starts streaming.
+    # Invalid files become error lines instead of failing the whole batch.
+    started = time.perf_counter()
+    uploads: List[IngestedUpload] = []
+    rejected: List[Dict[str, Any]] = []
+    total_bytes = 0
+    
+    def add_upload(upload: IngestedUpload):
+        nonlocal total_bytes
+        total_bytes += upload.size
+        if total_bytes > BATCH_MAX_TOTAL_BYTES:
+            raise BatchLimitExceeded(status_code=413, detail=f"Batch exceeds the maximum total decompressed size of {BATCH_MAX_TOTAL_BYTES} bytes")
+        uploads.append(upload)
+    
+    def check_file_count():
+        # Checked before each file is read, so an oversized archive is never fully inflated
+        if len(uploads) >= BATCH_MAX_FILES:
+            raise BatchLimitExceeded(status_code=400, detail=f"A batch may contain at most {BATCH_MAX_FILES} files")
+    
+    for file in files:
+        try:
+            if (file.filename or "").lower().endswith(".zip"):
+                archive_upload = await ingest_upload(file, ['.zip'], "Only .zip archives are allowed", max_size=BATCH_MAX_ARCHIVE_SIZE)
+                with zipfile.ZipFile(io.BytesIO(archive_upload.content)) as archive:
+                    for info in archive.infolist():
+                        name = os.path.basename(info.filename)
+                        # Skip directories and macOS resource-fork entries
+                        if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                            continue
+                        check_file_count()
+                        try:
+                            add_upload(ingest_zip_member(archive, info, allowed_exts, error_detail, BATCH_MAX_TOTAL_BYTES - total_bytes))
+                        except BatchLimitExceeded:
+                            raise
+                        except HTTPException as e:
+                            rejected.append({"type": "error", "filename": info.filename, "error": str(e.detail)})
+            else:
+                check_file_count()
+                add_upload(await ingest_upload(file, allowed_exts, error_detail))
+        except BatchLimitExceeded:
+            raise
+        except HTTPException as e:
+            rejected.append({"type": "error", "filename": file.filename, "error": str(e.detail)})
+        except zipfile.BadZipFile:
+            rejected.append({"type": "error", "filename": file.filename, "error": "Invalid zip archive"})
+    
+    # Identical files are processed once and their result is reported for every filename
+    unique_uploads: Dict[str, IngestedUpload] = {}
+    filenames_by_hash: Dict[str, List[str]] = {}
+    for upload in uploads:
+        unique_uploads.setdefault(upload.sha256, upload)
+        filenames_by_hash.setdefault(upload.sha256, []).append(upload.filename)
+    
+    async def result_stream():
+        for entry in rejected:
+            yield json.dumps(entry) + "\n"
         
-        # Calculate total classes: working days × classes per day
-        total_classes = calendar_working_days * classes_per_working_day if classes_per_working_day > 0 else calendar_working_days
+        semaphore = asyncio.Semaphore(parallelism)
         
-        # Calculate combined confidence score
-        calendar_confidence = calendar_analysis.get('confidence_score', 0.0)
-        timetable_confidence = timetable_analysis.get('confidence_score', 0.0)
-        combined_confidence = (calendar_confidence + timetable_confidence) / 2
+        async def run(sha256: str, upload: IngestedUpload):
+            async with semaphore:
+                try:
+                    result = await process(upload)
+                    return sha256, result.model_dump(), None
+                except HTTPException as e:
+                    return sha256, None, str(e.detail)
+                except Exception as e:
+                    logger.error(f"Batch item {upload.filename} failed: {e}")
+                    return sha256, None, str(e)
         
-        return CombinedProcessingResult(
-            calendar_events=calendar_events,
-            timetable_events=timetable_events,
-            total_working_days=calendar_working_days,
-            calendar_working_days=calendar_working_days,
-            timetable_working_days=len([day for day, classes in weekly_schedule.items() if classes]),
-            semester_start=calendar_analysis.get('semester_start'),
-            semester_end=calendar_analysis.get('semester_end'),
-            confidence_score=combined_confidence,
-            total_classes=total_classes,
-            classes_per_working_day=classes_per_working_day,
-            weekly_schedule=weekly_schedule
-        )
+        tasks = [asyncio.create_task(run(sha256, upload)) for sha256, upload in unique_uploads.items()]
+        failed = len(rejected)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                sha256, result, error = await next_done
+                names = filenames_by_hash[sha256]
+                for index, filename in enumerate(names):
+                    entry = {"type": "result" if error is None else "error", "filename": filename, "sha256": sha256}
+                    if index > 0:
+                        entry["duplicate_of"] = names[0]
+                    if error is None:
+                        entry["result"] = result
+                    else:
+                        entry["error"] = error
+                        failed += 1
+                    yield json.dumps(entry) + "\n"
+        finally:
+            # Stop outstanding work if the client disconnects mid-stream
+            for task in tasks:
+                task.cancel()
         
-    except Exception as e:
-        logger.error(f"Error processing combined files: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing files: {str(e)}")
-    finally:
-        # Clean up uploaded files
-        for path in [calendar_path, timetable_path]:
-            if os.path.exists(path):
-                os.remove(path)
+        yield json.dumps({
+            "type": "summary",
+            "kind": kind,
+            "files": len(uploads) + len(rejected),
+            "unique_files": len(unique_uploads),
+            "failed": failed,
+            "seconds": round(time.perf_counter() - started, 3)
+        }) + "\n"
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
 
 @app.post("/calculate-combined-attendance", response_model=AttendanceStats)
 async def calculate_combined_attendance(
@@ -886,34 +4051,60 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime counters for caches and processing pipelines"""
+    return {
+        "extraction_cache": extraction_cache.stats(),
+        "page_cache": page_cache.stats(),
+        "llm_cache": llm_result_cache.stats(),
+        "llm_repairs": llm_repair_stats.stats(),
+        "users": {
+            **user_repository.stats(),
+            "last_login": last_login_buffer.stats(),
+            "registrations": registration_writer.stats()
+        },
+        "auth": {"tokens": access_tokens.stats(), "user_cache": user_cache.stats()},
+        "analysis_tiers": analysis_tier_stats.stats(),
+        "prompt_filters": {
+            "calendar": calendar_relevance_filter.stats(),
+            "timetable": timetable_relevance_filter.stats()
+        },
+        "executors": {
+            "extraction": extraction_executor.stats()
+        },
+        "llm": llm_client.stats() if llm_client is not None else None,
+        "jobs": job_manager.stats(),
+        "ocr_engine": get_ocr_engine().stats()
+    }
+
 @app.post("/debug-pdf")
 async def debug_pdf(file: UploadFile = File(...)):
     """Debug endpoint to see extracted text from PDF"""
-    
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    upload = await ingest_upload(file, PDF_EXTENSIONS, "Only PDF files are allowed")
     
     try:
-        # Save uploaded file
-        temp_path = os.path.join(UPLOAD_DIR, f"debug_{datetime.now().timestamp()}.pdf")
-        async with aiofiles.open(temp_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        
-        # Extract text from PDF
-        extracted_text = extract_text_from_pdf(temp_path)
-        
-        # Clean up temp file
-        os.remove(temp_path)
+        # Extract text page by page (bypasses the cache so the per-page report is always fresh)
+        pages = await extraction_executor.run(extract_pdf_pages, upload.content)
+        extracted_text = "".join(page["text"] + "\n" for page in pages)
+        if extracted_text.strip():
+            extraction_cache.set(extraction_cache_key(upload.sha256), extracted_text)
         
         return {
             "filename": file.filename,
+            "sha256": upload.sha256,
             "text_length": len(extracted_text),
+            "pages": [
+                {"page": page["page"], "method": page["method"], "chars": page["chars"], "seconds": page["seconds"]}
+                for page in pages
+            ],
             "extracted_text": extracted_text,
             "first_500_chars": extracted_text[:500],
             "last_500_chars": extracted_text[-500:] if len(extracted_text) > 500 else ""
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
@@ -921,31 +4112,14 @@ async def debug_pdf(file: UploadFile = File(...)):
 @app.post("/debug-timetable")
 async def debug_timetable(file: UploadFile = File(...)):
     """Debug endpoint to see AI analysis of timetable"""
-    
-    allowed_exts = ['.pdf', '.jpg', '.jpeg', '.png']
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in allowed_exts:
-        raise HTTPException(status_code=400, detail="Only PDF or image files (.pdf, .jpg, .jpeg, .png) are allowed")
+    upload = await ingest_upload(file, TIMETABLE_EXTENSIONS, "Only PDF or image files (.pdf, .jpg, .jpeg, .png) are allowed")
     
     try:
-        # Save uploaded file
-        temp_path = os.path.join(UPLOAD_DIR, f"debug_timetable_{datetime.now().timestamp()}{ext}")
-        async with aiofiles.open(temp_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        
         # Extract text
-        if ext == '.pdf':
-            extracted_text = extract_text_from_pdf(temp_path)
-        else:
-            img = Image.open(temp_path)
-            extracted_text = pytesseract.image_to_string(img)
-        
-        # Analyze with AI
-        ai_result = analyze_timetable_with_ai(extracted_text)
+        extracted_text = await extraction_executor.run(extract_upload_text, upload)
         
-        # Clean up temp file
-        os.remove(temp_path)
+        # Analyze (local parser first, LLM when it is not confident)
+        ai_result = await analyze_timetable(extracted_text)
         
         return {
             "filename": file.filename,
@@ -957,6 +4131,8 @@ async def debug_timetable(file: UploadFile = File(...)):
             "confidence_score": ai_result.get('confidence_score', 0.0)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing timetable: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing timetable: {str(e)}")
@@ -975,7 +4151,7 @@ async def test_subject_extraction():
     """
     
     # Test AI analysis
-    ai_result = analyze_timetable_with_ai(sample_text)
+    ai_result = await analyze_timetable_with_ai(sample_text)
     
     # Test fallback method
     fallback_result = extract_basic_timetable(sample_text)
@@ -0,0 +1,292 @@
+"""
+OCR of PDF pages and images: Tesseract engines, page rasterization and preprocessing
+
+Kept free of import-time side effects so OCR worker processes (started with forkserver
+or spawn) can import it without building the API app, user store or LLM clients.
+"""
+
+import os
+import queue
+import math
+import tempfile
+import subprocess
+import threading
+import time
+import logging
+from typing import List, Optional, Dict, Any
+
+import pypdfium2 as pdfium
+import pytesseract
+from PIL import Image
+import cv2
+import numpy as np
+
+# Optional: tesserocr keeps Tesseract loaded in-process, avoiding a subprocess per image
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# OCR configuration
+# OCR engine: "tesserocr" (persistent in-process workers), "batch" (one tesseract call per
+# group of pages), "cli" (one tesseract call per image) or "auto" (tesserocr if installed, else batch)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+TESSERACT_POOL_SIZE = int(os.getenv("TESSERACT_POOL_SIZE", "2"))
+OCR_BATCH_PAGES = int(os.getenv("OCR_BATCH_PAGES", "8"))
+# Page rasterization for OCR; pages above OCR_MAX_PIXELS (e.g. posters) are rendered at a lower DPI
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", str(20_000_000)))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+OCR_DESKEW = os.getenv("OCR_DESKEW", "false").lower() == "true"
+OCR_DENOISE = os.getenv("OCR_DENOISE", "false").lower() == "true"
+
+# OCR engines
+class OCREngine:
+    """Turns images into text; subclasses differ in how they drive Tesseract"""
+    name = "base"
+
+    def __init__(self):
+        self.images = 0
+        self.invocations = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def image_to_string(self, image: Image.Image) -> str:
+        return self.images_to_strings([image])[0]
+
+    def images_to_strings(self, images: List[Image.Image]) -> List[str]:
+        """OCR images in order; output matches pytesseract.image_to_string per image"""
+        if not images:
+            return []
+        start = time.perf_counter()
+        texts, invocations = self._run(images)
+        with self._lock:
+            self.images += len(images)
+            self.invocations += invocations
+            self.seconds += time.perf_counter() - start
+        return texts
+
+    def _run(self, images: List[Image.Image]) -> tuple:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": self.name,
+            "images": self.images,
+            "invocations": self.invocations,
+            "average_image_seconds": round(self.seconds / self.images, 4) if self.images else 0.0
+        }
+
+class TesseractCLIEngine(OCREngine):
+    """One tesseract subprocess per image (pytesseract's default behaviour)"""
+    name = "cli"
+
+    def _run(self, images: List[Image.Image]) -> tuple:
+        return [pytesseract.image_to_string(image, lang=OCR_LANG) for image in images], len(images)
+
+class TesseractBatchEngine(OCREngine):
+    """One tesseract subprocess for many images, passed as a list file
+
+    Tesseract loads its language model once per invocation and ends each image's
+    text with a form feed, so the output splits back into per-image strings.
+    """
+    name = "batch"
+
+    def _run(self, images: List[Image.Image]) -> tuple:
+        if len(images) == 1:
+            return [pytesseract.image_to_string(images[0], lang=OCR_LANG)], 1
+        with tempfile.TemporaryDirectory(prefix="tess_batch_") as temp_dir:
+            image_paths = []
+            for index, image in enumerate(images):
+                # Same conversion pytesseract applies before writing its temp image
+                prepared, extension = pytesseract.pytesseract.prepare(image)
+                image_path = os.path.join(temp_dir, f"page_{index:04d}.{extension}")
+                prepared.save(image_path, format=prepared.format)
+                image_paths.append(image_path)
+            list_path = os.path.join(temp_dir, "images.txt")
+            with open(list_path, 'w') as file:
+                file.write("\n".join(image_paths) + "\n")
+            output_base = os.path.join(temp_dir, "output")
+            subprocess.run(
+                [pytesseract.pytesseract.tesseract_cmd, list_path, output_base, "-l", OCR_LANG],
+                check=True,
+                capture_output=True
+            )
+            with open(output_base + ".txt", encoding="utf-8") as file:
+                output = file.read()
+        
+        pages = output.split("\f")
+        if len(pages) != len(images) + 1:
+            logger.warning(f"Batched OCR returned {len(pages) - 1} pages for {len(images)} images, retrying one by one")
+            return [pytesseract.image_to_string(image, lang=OCR_LANG) for image in images], 1 + len(images)
+        return [page + "\f" for page in pages[:-1]], 1
+
+class TesserocrPoolEngine(OCREngine):
+    """Pool of long-lived in-process Tesseract handles; each loads the language model once"""
+    name = "tesserocr"
+
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+        self._created = 0
+        self._idle: "queue.Queue" = queue.Queue()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+        return self._idle.get()
+
+    def _run(self, images: List[Image.Image]) -> tuple:
+        api = self._acquire()
+        try:
+            texts = []
+            for image in images:
+                api.SetImage(image)
+                # The CLI text renderer ends every page with a form feed
+                texts.append(api.GetUTF8Text() + "\f")
+            return texts, 0
+        finally:
+            self._idle.put(api)
+
+def create_ocr_engine(name: str) -> OCREngine:
+    """Build the OCR engine named by OCR_ENGINE"""
+    if name == "auto":
+        name = "tesserocr" if tesserocr is not None else "batch"
+    if name == "tesserocr":
+        if tesserocr is None:
+            raise RuntimeError("OCR_ENGINE=tesserocr requires the tesserocr package")
+        return TesserocrPoolEngine(TESSERACT_POOL_SIZE)
+    if name == "batch":
+        return TesseractBatchEngine()
+    if name == "cli":
+        return TesseractCLIEngine()
+    raise ValueError(f"Unknown OCR engine: {name}")
+
+_ocr_engine: Optional[OCREngine] = None
+_ocr_engine_lock = threading.Lock()
+
+def get_ocr_engine() -> OCREngine:
+    """Return this process's OCR engine, creating it on first use"""
+    global _ocr_engine
+    with _ocr_engine_lock:
+        if _ocr_engine is None:
+            _ocr_engine = create_ocr_engine(OCR_ENGINE)
+        return _ocr_engine
+
+def reset_ocr_engine():
+    """Drop any inherited engine so forked OCR workers build their own Tesseract handles"""
+    global _ocr_engine, _ocr_engine_lock
+    _ocr_engine = None
+    _ocr_engine_lock = threading.Lock()
+
+class OCRPreprocessConfig:
+    """Rasterization and preprocessing settings for OCR'd PDF pages"""
+
+    def __init__(
+        self,
+        dpi: int = OCR_DPI,
+        max_pixels: int = OCR_MAX_PIXELS,
+        grayscale: bool = OCR_GRAYSCALE,
+        deskew: bool = OCR_DESKEW,
+        denoise: bool = OCR_DENOISE
+    ):
+        self.dpi = dpi
+        self.max_pixels = max_pixels
+        self.grayscale = grayscale
+        self.deskew = deskew
+        self.denoise = denoise
+
+    def describe(self) -> str:
+        flags = [f"{self.dpi}dpi", "gray" if self.grayscale else "color"]
+        if self.deskew:
+            flags.append("deskew")
+        if self.denoise:
+            flags.append("denoise")
+        return "+".join(flags)
+
+def render_page_for_ocr(page: "pdfium.PdfPage", config: OCRPreprocessConfig) -> tuple:
+    """Render a PDF page to a grayscale array at the configured DPI, capped at max_pixels
+
+    Returns (array, bitmap); the array is a view of the bitmap's buffer, so keep the bitmap alive.
+    """
+    width, height = page.get_size()
+    scale = config.dpi / 72
+    pixels = width * scale * height * scale
+    if pixels > config.max_pixels:
+        # Downscale before rendering so huge pages never allocate a full-resolution bitmap
+        scale *= math.sqrt(config.max_pixels / pixels)
+    bitmap = page.render(scale=scale, grayscale=config.grayscale)
+    array = bitmap.to_numpy()
+    if array.ndim == 3:
+        array = cv2.cvtColor(array, cv2.COLOR_BGRA2GRAY if array.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return array, bitmap
+
+def deskew_image(binary: np.ndarray) -> np.ndarray:
+    """Rotate a thresholded page so its text lines are horizontal"""
+    coords = cv2.findNonZero(cv2.bitwise_not(binary))
+    if coords is None:
+        return binary
+    angle = cv2.minAreaRect(coords)[-1]
+    # The reported angle range differs between OpenCV versions; map it to the smallest rotation
+    if angle < -45:
+        angle += 90
+    elif angle > 45:
+        angle -= 90
+    if abs(angle) < 0.1:
+        return binary
+    height, width = binary.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(binary, matrix, (width, height), flags=cv2.INTER_NEAREST, borderValue=255)
+
+def preprocess_for_ocr(gray: np.ndarray, config: OCRPreprocessConfig) -> np.ndarray:
+    """Denoise, Otsu-threshold and optionally deskew a grayscale page, in place where OpenCV allows"""
+    if config.denoise:
+        cv2.medianBlur(gray, 3, dst=gray)
+    cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=gray)
+    if config.deskew:
+        gray = deskew_image(gray)
+    return gray
+
+def ocr_pdf_pages(pdf_data: bytes, page_numbers: List[int], config: Optional[OCRPreprocessConfig] = None) -> List[tuple]:
+    """OCR the given pages of a PDF in order, returning (text, seconds) per page
+
+    Also runs inside OCR worker processes.
+    """
+    config = config or OCRPreprocessConfig()
+    engine = get_ocr_engine()
+    results = []
+    pdf = pdfium.PdfDocument(pdf_data)
+    try:
+        # Rasterize a group of pages, then OCR the group in one engine call
+        for group_start in range(0, len(page_numbers), OCR_BATCH_PAGES):
+            group = page_numbers[group_start:group_start + OCR_BATCH_PAGES]
+            images = []
+            render_seconds = []
+            for page_number in group:
+                start = time.perf_counter()
+                page = pdf[page_number]
+                gray, bitmap = render_page_for_ocr(page, config)
+                # Image.fromarray shares a contiguous array's buffer, which may still be the bitmap's;
+                # copy the pixels so the bitmap can be released before the image is OCR'd
+                images.append(Image.fromarray(preprocess_for_ocr(gray, config)).copy())
+                bitmap.close()
+                page.close()
+                render_seconds.append(time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            texts = engine.images_to_strings(images)
+            ocr_seconds = (time.perf_counter() - start) / len(group)
+            for page_text, seconds in zip(texts, render_seconds):
+                results.append((page_text, seconds + ocr_seconds))
+    finally:
+        pdf.close()
+    return results
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Load-test the processing endpoints and report throughput and p50/p95/p99 latency
+
+Drives a running backend over HTTP at each concurrency level. To measure the AI
+path offline, start the LLM stub server and point the backend at it, with the
+local-parser tier and LLM cache disabled so every request reaches the model:
+
+    python -m benchmarks.llm_stub_server --port 8100 --latency-ms 800 &
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8100/v1 \\
+        ANALYSIS_CONFIDENCE_THRESHOLD=2 LLM_CACHE_TTL_SECONDS=0 python run_backend.py &
+    python -m benchmarks.endpoint_load_benchmark --endpoint combined --concurrency 1,4,16 --requests 32
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+SAMPLE_PDF = "BBA_MM_III_Yr_Acad Calendar_2025-26 .pdf"
+SAMPLE_TIMETABLE = "PHOTO-2025-07-14-00-41-52.jpg"
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def build_request(endpoint: str, calendar: bytes, timetable: bytes) -> tuple:
+    """Return (path, files) for one request to the chosen endpoint"""
+    if endpoint == "calendar":
+        return "/upload-calendar", {"file": ("calendar.pdf", calendar, "application/pdf")}
+    if endpoint == "timetable":
+        return "/upload-timetable", {"file": ("timetable.jpg", timetable, "image/jpeg")}
+    return "/process-combined", {
+        "calendar_file": ("calendar.pdf", calendar, "application/pdf"),
+        "timetable_file": ("timetable.jpg", timetable, "image/jpeg")
+    }
+
+
+async def run_level(client: httpx.AsyncClient, path: str, files: dict, concurrency: int, requests: int) -> dict:
+    """Send `requests` requests with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, files=files)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    wall = time.perf_counter() - start
+    return {
+        "throughput": len(latencies) / wall,
+        "p50": percentile(latencies, 0.50) if latencies else float("nan"),
+        "p95": percentile(latencies, 0.95) if latencies else float("nan"),
+        "p99": percentile(latencies, 0.99) if latencies else float("nan"),
+        "mean": statistics.mean(latencies) if latencies else float("nan"),
+        "errors": errors
+    }
+
+
+async def run(args: argparse.Namespace):
+    with open(args.calendar, "rb") as file:
+        calendar = file.read()
+    with open(args.timetable, "rb") as file:
+        timetable = file.read()
+    path, files = build_request(args.endpoint, calendar, timetable)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        # One warm-up request so extraction caches and connections are primed
+        await client.post(path, files=files)
+        print(f"📈 {path}: {args.requests} requests per level")
+        print(f"{'concurrency':>12}{'req/s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'mean s':>9}{'errors':>8}")
+        for level in levels:
+            result = await run_level(client, path, files, level, args.requests)
+            print(
+                f"{level:>12}{result['throughput']:>9.2f}{result['p50']:>9.3f}{result['p95']:>9.3f}"
+                f"{result['p99']:>9.3f}{result['mean']:>9.3f}{result['errors']:>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Backend to load")
+    parser.add_argument("--endpoint", choices=["calendar", "timetable", "combined"], default="calendar")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--calendar", default=SAMPLE_PDF, help="Calendar PDF to upload")
+    parser.add_argument("--timetable", default=SAMPLE_TIMETABLE, help="Timetable image to upload")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
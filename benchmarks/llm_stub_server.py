@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+OpenAI-compatible stand-in for load testing the AI path without API keys
+
+Serves POST /v1/chat/completions (plain and stream=true) with canned JSON,
+a configurable latency distribution and error rate. Point the backend at it:
+
+    python -m benchmarks.llm_stub_server --port 8100 --latency-ms 800 --error-rate 0.02
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8100/v1 python run_backend.py
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_RESPONSES = {
+    "calendar": {
+        "events": [
+            {"name": "Term I classes begin", "date": "2025-06-02", "type": "lecture", "description": "Academic instruction starts"},
+            {"name": "Mid-Term Test", "date": "2025-07-16", "type": "exam", "description": "Internal continuous assessment"},
+            {"name": "Term End Exams", "date": "2025-08-25", "type": "exam", "description": "End of term examinations"}
+        ],
+        "semester_start": "2025-06-02",
+        "semester_end": "2025-08-23",
+        "total_working_days": 70,
+        "confidence_score": 0.85
+    },
+    "timetable": {
+        "timetable_events": [
+            {"subject": "Mathematics", "day": "Monday", "time": "09:00-10:00", "room": "101", "instructor": "Dr. Smith"},
+            {"subject": "Physics", "day": "Tuesday", "time": "10:00-11:00", "room": "Lab 2", "instructor": "Prof. Johnson"},
+            {"subject": "Economics", "day": "Thursday", "time": "11:00-12:00", "room": "203", "instructor": "Ms. Davis"}
+        ],
+        "weekly_schedule": {
+            "Monday": [{"subject": "Mathematics", "day": "Monday", "time": "09:00-10:00"}],
+            "Tuesday": [{"subject": "Physics", "day": "Tuesday", "time": "10:00-11:00"}],
+            "Wednesday": [],
+            "Thursday": [{"subject": "Economics", "day": "Thursday", "time": "11:00-12:00"}],
+            "Friday": [],
+            "Saturday": []
+        },
+        "total_working_days": 3,
+        "confidence_score": 0.85
+    }
+}
+
+
+class StubSettings:
+    def __init__(self, args: argparse.Namespace):
+        self.latency_seconds = args.latency_ms / 1000
+        self.distribution = args.distribution
+        self.spread = args.spread
+        self.error_rate = args.error_rate
+        self.error_status = args.error_status
+        self.stream_pieces = args.stream_pieces
+        self.responses = dict(CANNED_RESPONSES)
+        if args.responses:
+            with open(args.responses, "r", encoding="utf-8") as file:
+                self.responses.update(json.load(file))
+        self.requests = 0
+        self.errors = 0
+
+    def sample_latency(self) -> float:
+        """Seconds for one response; --latency-ms is the median of every distribution"""
+        if self.distribution == "fixed":
+            return self.latency_seconds
+        if self.distribution == "uniform":
+            return random.uniform(self.latency_seconds * (1 - self.spread), self.latency_seconds * (1 + self.spread))
+        return random.lognormvariate(math.log(max(self.latency_seconds, 1e-6)), self.spread)
+
+
+def create_app(settings: StubSettings) -> FastAPI:
+    app = FastAPI(title="LLM stub server")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        settings.requests += 1
+        prompt = " ".join(message.get("content", "") for message in body.get("messages", []))
+        latency = settings.sample_latency()
+
+        if random.random() < settings.error_rate:
+            settings.errors += 1
+            await asyncio.sleep(latency / 2)
+            return JSONResponse(
+                status_code=settings.error_status,
+                content={"error": {"message": "Injected stub error", "type": "server_error", "code": None}}
+            )
+
+        kind = "timetable" if "timetable text" in prompt[:200] else "calendar"
+        content = json.dumps(settings.responses[kind])
+        completion_id = f"chatcmpl-stub-{settings.requests}"
+        model = body.get("model", "stub")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4}
+            }
+
+        async def events():
+            # A fifth of the latency before the first token, the rest spread over the pieces
+            await asyncio.sleep(latency * 0.2)
+            size = max(1, math.ceil(len(content) / settings.stream_pieces))
+            for start in range(0, len(content), size):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + size]}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(latency * 0.8 / settings.stream_pieces)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": settings.requests, "errors": settings.errors}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=800, help="Median response latency")
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--spread", type=float, default=0.3, help="Relative half-width (uniform) or sigma (lognormal)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status for injected errors, e.g. 429 or 500")
+    parser.add_argument("--stream-pieces", type=int, default=20, help="Number of chunks a streamed response is split into")
+    parser.add_argument("--responses", help="JSON file with canned 'calendar' and/or 'timetable' responses")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(StubSettings(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
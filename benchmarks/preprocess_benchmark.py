@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark OCR rasterization/preprocessing settings for time, peak memory and accuracy
+
+The sample calendar is rasterized into a scanned PDF (optionally skewed and with
+speckle noise), OCR'd under each setting, and compared against the calendar's own
+text layer. Each setting runs in a fresh process so peak RSS is measured cleanly.
+
+Run from the repository root:
+    python -m benchmarks.preprocess_benchmark --skew 1.5 --noise 0.02
+"""
+
+import argparse
+import difflib
+import io
+import multiprocessing
+import re
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pdfplumber
+import PyPDF2
+from PIL import Image
+
+SAMPLE_PDF = "BBA_MM_III_Yr_Acad Calendar_2025-26 .pdf"
+
+SETTINGS = [
+    # (dpi, grayscale, deskew, denoise)
+    (72, False, False, False),
+    (150, False, False, False),
+    (150, True, False, False),
+    (200, True, False, False),
+    (300, True, False, False),
+    (200, True, True, False),
+    (200, True, False, True),
+    (200, True, True, True),
+]
+
+
+def build_scanned_pdf(source_pdf: str, resolution: int, skew: float, noise: float) -> bytes:
+    """Rasterize the source PDF into an image-only PDF, simulating a slightly crooked, dusty scan"""
+    rng = np.random.default_rng(0)
+    pages = []
+    with pdfplumber.open(source_pdf) as pdf:
+        for page in pdf.pages:
+            image = page.to_image(resolution=resolution).original.convert("L")
+            if skew:
+                image = image.rotate(skew, resample=Image.BICUBIC, expand=True, fillcolor=255)
+            if noise:
+                pixels = np.array(image)
+                pixels[rng.random(pixels.shape) < noise] = 0
+                image = Image.fromarray(pixels)
+            pages.append(image)
+    output = io.BytesIO()
+    pages[0].save(output, format="PDF", save_all=True, append_images=pages[1:], resolution=resolution)
+    return output.getvalue()
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def run_setting(pdf_data: bytes, setting: tuple) -> tuple:
+    """OCR every page under one setting; runs in its own process"""
+    from backend.ocr import OCRPreprocessConfig, ocr_pdf_pages
+
+    dpi, grayscale, deskew, denoise = setting
+    config = OCRPreprocessConfig(dpi=dpi, grayscale=grayscale, deskew=deskew, denoise=denoise)
+    page_count = len(PyPDF2.PdfReader(io.BytesIO(pdf_data)).pages)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    results = ocr_pdf_pages(pdf_data, list(range(page_count)), config)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    text = "".join(page_text + "\n" for page_text, _ in results)
+    return config.describe(), elapsed, (peak_kb - baseline_kb) / 1024, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=SAMPLE_PDF, help="Text-layer PDF used as scan source and ground truth")
+    parser.add_argument("--scan-resolution", type=int, default=300, help="DPI of the simulated scan")
+    parser.add_argument("--skew", type=float, default=0.0, help="Rotation applied to the scan, in degrees")
+    parser.add_argument("--noise", type=float, default=0.0, help="Fraction of pixels turned into black speckles")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as file:
+        reference = normalize("".join(page.extract_text() + "\n" for page in PyPDF2.PdfReader(file).pages))
+    pdf_data = build_scanned_pdf(args.pdf, args.scan_resolution, args.skew, args.noise)
+    print(f"📄 Scan: {args.scan_resolution} DPI, skew {args.skew}°, noise {args.noise:.0%}")
+
+    print(f"{'setting':<28}{'seconds':>9}{'peak MB':>9}{'accuracy':>10}")
+    context = multiprocessing.get_context("spawn")
+    for setting in SETTINGS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            name, elapsed, peak_mb, text = pool.submit(run_setting, pdf_data, setting).result()
+        accuracy = difflib.SequenceMatcher(None, normalize(text), reference, autojunk=False).ratio()
+        print(f"{name:<28}{elapsed:>9.2f}{peak_mb:>9.1f}{accuracy:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark the relevance pre-filter: prompt size and end-to-end LLM latency
+
+Analyzes the sample calendar with the filter disabled and enabled. Uses the
+configured OpenAI/Gemini provider when an API key is set; otherwise latency is
+simulated from prompt size (--simulate-ms-per-1k-chars) and labelled as such.
+The LLM result cache is bypassed so every run reaches the provider.
+
+Run from the repository root:
+    python -m benchmarks.prompt_filter_benchmark --repeat 3
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import backend.main as backend
+from backend.main import LLMClient, LLMProvider, calendar_prompt, calendar_relevance_filter, extract_text_from_pdf
+
+SAMPLE_PDF = "BBA_MM_III_Yr_Acad Calendar_2025-26 .pdf"
+
+
+class SimulatedProvider(LLMProvider):
+    """Latency grows with prompt size, roughly like a hosted model's prompt processing"""
+
+    name = "simulated"
+
+    def __init__(self, base_seconds: float, seconds_per_1k_chars: float):
+        super().__init__("simulated")
+        self.base_seconds = base_seconds
+        self.seconds_per_1k_chars = seconds_per_1k_chars
+
+    async def complete(self, prompt: str, timeout: float) -> str:
+        await asyncio.sleep(self.base_seconds + len(prompt) / 1000 * self.seconds_per_1k_chars)
+        return '{"events": [], "total_working_days": 0, "confidence_score": 0.5}'
+
+
+async def time_analysis(text: str, enabled: bool, repeat: int) -> float:
+    """Median seconds for analyze_calendar_with_ai with the filter on or off"""
+    calendar_relevance_filter.enabled = enabled
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await backend.analyze_calendar_with_ai(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+async def compare(text: str, repeat: int) -> tuple:
+    return await time_analysis(text, False, repeat), await time_analysis(text, True, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=SAMPLE_PDF, help="Calendar PDF to analyze")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode; the median is reported")
+    parser.add_argument("--simulate-base-seconds", type=float, default=1.0, help="Fixed simulated latency per call")
+    parser.add_argument("--simulate-ms-per-1k-chars", type=float, default=400.0, help="Simulated latency per 1000 prompt chars")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as file:
+        text = extract_text_from_pdf(file.read())
+    filtered = calendar_relevance_filter.apply(text)
+    raw_prompt, filtered_prompt = calendar_prompt(text), calendar_prompt(filtered)
+
+    print(f"{'prompt':<12}{'text chars':>12}{'prompt chars':>14}{'~tokens':>10}")
+    print(f"{'raw':<12}{len(text):>12}{len(raw_prompt):>14}{len(raw_prompt) // 4:>10}")
+    print(f"{'filtered':<12}{len(filtered):>12}{len(filtered_prompt):>14}{len(filtered_prompt) // 4:>10}")
+    print(f"✂️  Prompt reduction: {1 - len(filtered_prompt) / len(raw_prompt):.1%}")
+
+    backend.llm_result_cache.ttl_seconds = 0
+    simulated = backend.llm_client is None
+    if simulated:
+        backend.llm_client = LLMClient(
+            SimulatedProvider(args.simulate_base_seconds, args.simulate_ms_per_1k_chars / 1000),
+            max_concurrency=1, timeout=60, deadline=120, max_retries=0, backoff_base=0.5, backoff_max=8
+        )
+        print("ℹ️  No API key configured - latency below is simulated from prompt size")
+
+    raw_seconds, filtered_seconds = asyncio.run(compare(text, args.repeat))
+    print(f"{'mode':<12}{'seconds':>10}")
+    print(f"{'raw':<12}{raw_seconds:>10.2f}")
+    print(f"{'filtered':<12}{filtered_seconds:>10.2f}")
+    print(f"⚡ Latency change: {filtered_seconds / raw_seconds - 1:+.1%} ({backend.llm_client.provider.name})")
+
+
+if __name__ == "__main__":
+    main()
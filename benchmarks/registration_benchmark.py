@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark registration throughput under a burst of concurrent sign-ups
+
+Compares one durable commit per registration (each request calling the store
+directly) with the group-commit RegistrationWriter, for both user stores. Every
+run starts from a fresh store in a temporary directory.
+
+Run from the repository root:
+    python -m benchmarks.registration_benchmark --users 2000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from backend.main import CSVUserRepository, RegistrationWriter, SQLiteUserRepository, UserAlreadyExists
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_user(index: int) -> dict:
+    return {
+        "username": f"student{index:06d}",
+        "email": f"student{index:06d}@example.edu",
+        "password_hash": "0" * 64,
+        "full_name": f"Student {index}",
+        "created_at": "2025-07-01T09:00:00",
+        "last_login": "2025-07-01T09:00:00"
+    }
+
+
+def create_repository(store: str, directory: str):
+    if store == "csv":
+        return CSVUserRepository(os.path.join(directory, "users.csv"))
+    return SQLiteUserRepository(os.path.join(directory, "users.db"))
+
+
+async def run_burst(register, users: int, concurrency: int) -> dict:
+    """Register `users` users with at most `concurrency` requests in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(index: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await register(make_user(index))
+                latencies.append(time.perf_counter() - start)
+            except UserAlreadyExists:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(index) for index in range(users)])
+    wall = time.perf_counter() - start
+    return {
+        "throughput": len(latencies) / wall,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "mean": statistics.mean(latencies),
+        "errors": errors
+    }
+
+
+async def run(args: argparse.Namespace):
+    print(f"📈 {args.users} registrations, {args.concurrency} in flight")
+    print(f"{'store':<8}{'mode':<14}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'batches':>9}")
+    for store in ["csv", "sqlite"]:
+        for mode in ["per-request", "group-commit"]:
+            with tempfile.TemporaryDirectory(prefix="registration_bench_") as directory:
+                repository = create_repository(store, directory)
+                batches = args.users
+                if mode == "per-request":
+                    result = await run_burst(lambda user: asyncio.to_thread(repository.add, user), args.users, args.concurrency)
+                else:
+                    writer = RegistrationWriter(repository, args.batch_max, args.batch_wait_ms / 1000)
+                    result = await run_burst(writer.register, args.users, args.concurrency)
+                    batches = writer.batches
+                    await writer.stop()
+                assert repository.count() == args.users - result["errors"]
+                repository.close()
+            print(
+                f"{store:<8}{mode:<14}{result['throughput']:>10.0f}{result['p50'] * 1000:>9.1f}"
+                f"{result['p95'] * 1000:>9.1f}{result['mean'] * 1000:>9.1f}{batches:>9}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000, help="Registrations in the burst")
+    parser.add_argument("--concurrency", type=int, default=200, help="Registrations in flight at once")
+    parser.add_argument("--batch-max", type=int, default=256, help="Largest group commit")
+    parser.add_argument("--batch-wait-ms", type=float, default=2.0, help="How long a batch waits to fill")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
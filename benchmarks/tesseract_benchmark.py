@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-image OCR latency for each OCR engine
+
+Compares a tesseract subprocess per image (the previous path), one batched
+tesseract invocation, and persistent tesserocr workers when installed.
+
+Run from the repository root:
+    python -m benchmarks.tesseract_benchmark --images 20
+"""
+
+import argparse
+import time
+
+from PIL import Image, ImageDraw
+
+from backend.ocr import create_ocr_engine, tesserocr
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+SUBJECTS = ["Mathematics", "Physics", "Marketing", "Economics", "Statistics", "English"]
+
+
+def make_timetable_image(index: int) -> Image.Image:
+    """Render a small timetable snippet, similar to a cropped phone photo of a timetable"""
+    image = Image.new("L", (640, 160), color=255)
+    draw = ImageDraw.Draw(image)
+    for row in range(4):
+        day = DAYS[(index + row) % len(DAYS)]
+        subject = SUBJECTS[(index * 3 + row) % len(SUBJECTS)]
+        draw.text((12, 12 + row * 36), f"{day} {9 + row}:00-{10 + row}:00 {subject} Room {100 + index}", fill=0)
+    return image.resize((1280, 320))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20, help="Number of timetable images to OCR")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per engine; the best time is reported")
+    args = parser.parse_args()
+
+    images = [make_timetable_image(i) for i in range(args.images)]
+    engines = ["cli", "batch"] + (["tesserocr"] if tesserocr is not None else [])
+    if tesserocr is None:
+        print("ℹ️  tesserocr not installed - skipping the persistent worker engine")
+
+    results = {}
+    for name in engines:
+        engine = create_ocr_engine(name)
+        engine.images_to_strings(images[:1])  # Warm up (loads the model for tesserocr)
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            if name == "cli":
+                # Previous behaviour: one call per uploaded image
+                texts = [engine.image_to_string(image) for image in images]
+            else:
+                texts = engine.images_to_strings(images)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = (best, texts)
+
+    baseline_seconds, baseline_texts = results["cli"]
+    print(f"{'engine':<12}{'ms/image':>10}{'speedup':>10}  output")
+    for name, (seconds, texts) in results.items():
+        same = "identical" if texts == baseline_texts else "differs from cli"
+        print(f"{name:<12}{seconds / args.images * 1000:>10.1f}{baseline_seconds / seconds:>9.2f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
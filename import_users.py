@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+One-shot import of users.csv into the SQLite user store
+
+Existing usernames/emails are skipped, so it is safe to re-run:
+    python import_users.py --csv users.csv --database-url sqlite:///users.db
+"""
+
+import argparse
+import os
+
+from backend.main import SQLiteUserRepository, import_users_from_csv, sqlite_path_from_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=os.getenv("USERS_CSV_FILE", "users.csv"), help="CSV file to import")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///users.db"), help="Target SQLite database")
+    args = parser.parse_args()
+
+    repository = SQLiteUserRepository(sqlite_path_from_url(args.database_url))
+    imported, skipped = import_users_from_csv(args.csv, repository)
+    print(f"✅ Imported {imported} users from {args.csv} ({skipped} already present)")
+    print(f"👥 {repository.count()} users in {repository.path}")
+    repository.close()
+
+
+if __name__ == "__main__":
+    main()